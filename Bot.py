@@ -1,17 +1,35 @@
 import os
 import asyncio
+import contextvars
+import re
+import shutil
+import functools
+import io
 import logging
+import tempfile
+import threading
+import time
 import warnings
-import zipfile
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from google.auth.transport.requests import Request
 from google.oauth2.service_account import Credentials
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload, MediaFileUpload
+from googleapiclient.http import MediaIoBaseDownload
 import discord
 from discord import app_commands
-from discord.ext import commands
-from discord.ext.commands import BucketType
+from discord.ext import commands, tasks
 import httpx
 from pathlib import Path
+from admission import AdmissionController, Rejected
+from drive_index import DriveFolderIndex
+from drive_scheduler import BACKGROUND, INTERACTIVE, ScheduledHttpRequest, scheduler
+from file_worker import FILE_WORKERS, FileWorkerPool, add_manifest, create_zip_file, download_to_path, upload_file
+from metrics import Counter, Gauge, Histogram, render as render_metrics
+from tracing import current_trace, resume, span, tracer
+from aiohttp import web
 
 
 warnings.filterwarnings("ignore", message="file_cache is only supported with oauth2client<4.0.0")
@@ -31,6 +49,12 @@ OFFICIAL_SERVER_IDS = {
 
 
 unauthorized_servers = set()
+# Placeholder for user IDs allowed to use the tracing and profiling commands
+ADMIN_USER_IDS = {
+
+}
+# Per-user/per-guild limits and the bounded queue that slash-command jobs run from
+admission = AdmissionController()
 
 
 SERVICE_ACCOUNT_INFO = {}
@@ -40,92 +64,694 @@ SERVICE_ACCOUNT_INFO = {}
 FOLDER_MANIFEST = "" 
 
 
+# Placeholder for the GitHub repositories (owner/name) searched for manifest branches
+REPOSITORIES = []
+
 GITHUB_TOKEN = ""  # Add your GitHub token here if needed
 GITHUB_HEADERS = {"Authorization": f"Bearer {GITHUB_TOKEN}"} if GITHUB_TOKEN else None
 
 
 
-http_client = httpx.AsyncClient()
+class TracedTransport(httpx.AsyncHTTPTransport):
+    async def handle_async_request(self, request):
+        with span("http", method=request.method, url=str(request.url.copy_with(query=None))):
+            return await super().handle_async_request(request)
+
+
+http_client = httpx.AsyncClient(transport=TracedTransport())
+
+
+# Prometheus-format metrics, served on the loopback interface only
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9108
+STAGE_SECONDS = Histogram("bot_stage_seconds", "Time spent in each pipeline stage.", ("stage",))
+STAGE_ERRORS = Counter("bot_stage_errors_total", "Pipeline stage failures.", ("stage",))
+TRANSFER_BYTES = Counter("bot_transfer_bytes_total", "Bytes moved between the bot and other services.", ("direction",))
+COMMANDS = Counter("bot_commands_total", "Slash command invocations by admission outcome.", ("command", "outcome"))
+JOB_SECONDS = Histogram("bot_job_seconds", "Time from a worker picking up a job to it finishing.", ("command",))
+QUEUE_WAIT_SECONDS = Histogram("bot_queue_wait_seconds", "Time admitted jobs waited for a worker.")
+QUEUE_DEPTH = Gauge("bot_queue_depth", "Admitted jobs waiting for a worker.")
+QUEUE_DEPTH.set_function(lambda: admission.depth)
+JOBS_RUNNING = Gauge("bot_jobs_running", "Jobs currently being worked on.")
+JOBS_RUNNING.set_function(lambda: admission.running)
+CACHE_HITS = Counter("bot_manifest_cache_hits_total", "Manifest cache lookups served locally.")
+CACHE_HITS.set_function(lambda: manifest_cache.hits)
+CACHE_MISSES = Counter("bot_manifest_cache_misses_total", "Manifest cache lookups that went to Drive.")
+CACHE_MISSES.set_function(lambda: manifest_cache.misses)
+CACHE_HIT_RATIO = Gauge("bot_manifest_cache_hit_ratio", "Share of manifest cache lookups served locally.")
+CACHE_HIT_RATIO.set_function(lambda: manifest_cache.hits / max(1, manifest_cache.hits + manifest_cache.misses))
+CACHE_BYTES = Gauge("bot_manifest_cache_bytes", "Bytes held in the manifest cache.")
+CACHE_BYTES.set_function(lambda: manifest_cache.total_bytes)
+DOWNLOADS_IN_FLIGHT = Gauge("bot_downloads_in_flight", "Distinct Drive downloads in progress.")
+DOWNLOADS_IN_FLIGHT.set_function(lambda: len(inflight_downloads))
+DRIVE_RETRIES = Counter("bot_drive_retries_total", "Drive requests retried by the scheduler.")
+DRIVE_RETRIES.set_function(lambda: scheduler.retries + (file_pool.retries if file_pool else 0))
+FILE_WORKER_JOBS = Gauge("bot_file_worker_jobs", "Jobs running in file worker processes.")
+FILE_WORKER_JOBS.set_function(lambda: file_pool.running if file_pool else 0)
+DRIVE_CIRCUIT_OPEN = Gauge("bot_drive_circuit_open", "1 while the Drive circuit breaker is open.")
+DRIVE_CIRCUIT_OPEN.set_function(lambda: int(drive_unavailable()))
+metrics_runner = None
+
+
+@contextmanager
+def stage(name):
+    with span(name), STAGE_SECONDS.time(stage=name):
+        yield
+
+
+async def serve_metrics(request):
+    return web.Response(
+        body=render_metrics().encode("utf-8"),
+        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+    )
+
+
+async def start_metrics_server():
+    global metrics_runner
+    if metrics_runner is not None:
+        return
+    app = web.Application()
+    app.router.add_get("/metrics", serve_metrics)
+    metrics_runner = web.AppRunner(app)
+    await metrics_runner.setup()
+    await web.TCPSite(metrics_runner, METRICS_HOST, METRICS_PORT).start()
+    logging.info(f"Serving metrics on http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+
+
+# Refresh the access token this long before it actually expires
+TOKEN_REFRESH_MARGIN = timedelta(minutes=5)
+
+
+class DriveServicePool:
+    """Process-wide Drive clients sharing one set of service account credentials.
+
+    httplib2 is not thread-safe, so every thread gets its own service object;
+    the credentials (and their access token) are shared between all of them.
+    """
+
+    def __init__(self, service_account_info, scopes):
+        self.credentials = Credentials.from_service_account_info(service_account_info, scopes=scopes)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._refreshing = None
+        self.hits = 0
+        self.builds = 0
+
+    def refresh_if_needed(self):
+        # Single flight: one thread makes the token request outside the lock. The others
+        # keep using a still-valid token, or wait for the refresh if it has expired.
+        with self._lock:
+            expiry = self.credentials.expiry
+            if self.credentials.valid and expiry and expiry - datetime.utcnow() > TOKEN_REFRESH_MARGIN:
+                return
+            done = self._refreshing
+            if done is None:
+                done = self._refreshing = threading.Event()
+                leader = True
+            else:
+                leader = False
+        if not leader:
+            if not self.credentials.valid:
+                done.wait()
+            return
+        try:
+            logging.info("Refreshing Google Drive access token...")
+            with stage("auth"):
+                self.credentials.refresh(Request())
+        finally:
+            with self._lock:
+                self._refreshing = None
+            done.set()
+
+    def get(self):
+        self.refresh_if_needed()
+        service = getattr(self._local, "service", None)
+        with self._lock:
+            if service is not None:
+                self.hits += 1
+                return service
+            self.builds += 1
+        service = build("drive", "v3", credentials=self.credentials, requestBuilder=ScheduledHttpRequest)
+        self._local.service = service
+        return service
+
+    def stats(self):
+        return {"hits": self.hits, "builds": self.builds}
+
+
+drive_pool = None
+drive_pool_lock = threading.Lock()
 
 
 def authenticate_with_google_drive():
+    global drive_pool
     try:
-        logging.info("Authenticating with Google Drive API...")
-        creds = Credentials.from_service_account_info(SERVICE_ACCOUNT_INFO, scopes=["https://www.googleapis.com/auth/drive"])
-        service = build("drive", "v3", credentials=creds)
-        logging.info("Successfully authenticated with Google Drive API.")
+        if drive_pool is None:
+            with drive_pool_lock:
+                if drive_pool is None:
+                    logging.info("Authenticating with Google Drive API...")
+                    pool = DriveServicePool(SERVICE_ACCOUNT_INFO, ["https://www.googleapis.com/auth/drive"])
+                    pool.refresh_if_needed()
+                    drive_pool = pool
+                    logging.info("Successfully authenticated with Google Drive API.")
+        service = drive_pool.get()
+        logging.debug(f"Drive service pool stats: {drive_pool.stats()}")
         return service
     except Exception as e:
         logging.error(f"Error authenticating with Google Drive API: {e}")
         return None
 
-async def check_file_exists(service, game_id):
+
+# The Drive client is blocking, so every call runs on this bounded pool instead of the event loop
+DRIVE_WORKERS = 8
+drive_executor = ThreadPoolExecutor(max_workers=DRIVE_WORKERS, thread_name_prefix="drive")
+
+
+def _call_with_service(priority, func, *args):
+    service = authenticate_with_google_drive()
+    if service is None:
+        raise RuntimeError("Google Drive service is unavailable.")
+    with scheduler.priority(priority):
+        return func(service, *args)
+
+
+async def run_drive(func, *args, priority=INTERACTIVE):
+    loop = asyncio.get_running_loop()
+    # Copying the context lets spans opened on the worker thread join the caller's trace
+    call = functools.partial(_call_with_service, priority, func, *args)
+    return await loop.run_in_executor(drive_executor, contextvars.copy_context().run, call)
+
+
+async def ensure_drive_service():
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(drive_executor, authenticate_with_google_drive) is not None
+
+
+# Downloads, zips and uploads run in these worker processes so they cannot stall the
+# gateway; set to 0 to keep them on drive_executor in this process instead
+file_pool = None
+
+
+def start_file_workers():
+    global file_pool
+    if FILE_WORKERS and file_pool is None:
+        if __name__ == "__main__":
+            # Spawned workers re-run the main script, which here is this whole module
+            logging.warning("Running file jobs in the bot process; start the bot with run_bot.py to use worker processes.")
+            return
+        # The workers share half of the Drive request budget; lookups here keep the rest
+        worker_rate = scheduler.rate / 2
+        scheduler.rate -= worker_rate
+        file_pool = FileWorkerPool(SERVICE_ACCOUNT_INFO, FILE_WORKERS, worker_rate)
+        logging.info(f"Started {FILE_WORKERS} file worker processes.")
+
+def drive_unavailable():
+    # Workers keep their own circuit breakers; any open one means Drive is failing
+    return scheduler.is_open or (file_pool is not None and file_pool.is_open)
+
+def _list_manifest_files(service, game_id):
+    query = f"'{FOLDER_MANIFEST}' in parents and name='{game_id}.zip'"
+    results = service.files().list(q=query, fields="files(id, name, size, md5Checksum, modifiedTime)").execute()
+    return results.get("files", [])
+
+
+# Local index of FOLDER_MANIFEST, refreshed from the Drive changes feed
+INDEX_FILE = "manifest_index.json"
+INDEX_SYNC_INTERVAL = 60
+INDEX_MAX_AGE = 5 * 60
+manifest_index = DriveFolderIndex(FOLDER_MANIFEST, INDEX_FILE)
+
+
+# The index sync in progress, so stale lookups and the background loop share one pass
+index_sync_task = None
+
+
+async def _sync_manifest_index(priority):
+    try:
+        changed = await run_drive(manifest_index.sync, priority=priority)
+        if changed:
+            logging.info(f"Manifest index updated: {changed} changes, {len(manifest_index)} files.")
+        return True
+    except Exception as e:
+        logging.error(f"Error syncing manifest index: {e}")
+        return False
+
+
+def _clear_index_sync(task):
+    global index_sync_task
+    if index_sync_task is task:
+        index_sync_task = None
+
+
+async def sync_manifest_index(priority=INTERACTIVE):
+    global index_sync_task
+    if index_sync_task is None:
+        index_sync_task = asyncio.ensure_future(_sync_manifest_index(priority))
+        index_sync_task.add_done_callback(_clear_index_sync)
+    return await asyncio.shield(index_sync_task)
+
+
+async def lookup_manifest(game_id):
+    with stage("lookup"):
+        if manifest_index.is_fresh(INDEX_MAX_AGE) or await sync_manifest_index():
+            return manifest_index.lookup(f"{game_id}.zip")
+        files = await run_drive(_list_manifest_files, game_id)
+        return files[0] if files else None
+
+
+@tasks.loop(seconds=INDEX_SYNC_INTERVAL)
+async def manifest_index_sync_loop():
+    await sync_manifest_index(BACKGROUND)
+
+
+async def check_file_exists(game_id):
     try:
-        query = f"'{FOLDER_MANIFEST}' in parents and name='{game_id}.zip'"
-        results = service.files().list(q=query, fields="files(id, name)").execute()
-        files = results.get("files", [])
-        return bool(files)
+        return await lookup_manifest(game_id) is not None
     except Exception as e:
         logging.error(f"Error checking if file exists: {e}")
         return False
 
 
-async def download_file(service, file_id, file_name):
+# Downloads are kept in memory up to this size before spilling to a temporary file
+STREAM_MEMORY_LIMIT = 64 * 1024 * 1024
+ATTACHMENT_SIZE = 9 * 1024 * 1024
+
+
+class MemoryPartReader(io.RawIOBase):
+    """Read-only file object over a memoryview slice, so parts are never copied up front."""
+
+    def __init__(self, view):
+        self._view = view
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: len(self._view)}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def readinto(self, b):
+        data = self._view[self._pos:self._pos + len(b)]
+        b[:len(data)] = data
+        self._pos += len(data)
+        return len(data)
+
+    def close(self):
+        self._view.release()
+        super().close()
+
+
+class FilePartReader(io.RawIOBase):
+    """Read-only file object over a byte range of an open file descriptor."""
+
+    def __init__(self, fd, offset, length):
+        self._fd = fd
+        self._start = offset
+        self._length = length
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: self._length}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def readinto(self, b):
+        size = min(len(b), self._length - self._pos)
+        if size <= 0:
+            return 0
+        data = os.pread(self._fd, size, self._start + self._pos)
+        b[:len(data)] = data
+        self._pos += len(data)
+        return len(data)
+
+
+class DownloadBuffer:
+    """Write target for Drive media chunks that stays in memory up to a ceiling."""
+
+    def __init__(self, memory_limit=STREAM_MEMORY_LIMIT):
+        self.memory_limit = memory_limit
+        self.size = 0
+        self._memory = io.BytesIO()
+        self._file = None
+        self._path = None
+        self._users = 0
+        self._closed = False
+
+    @classmethod
+    def from_file(cls, path):
+        """Take over a finished download on disk; the file is deleted by the last close()."""
+        buffer = cls()
+        buffer._memory = None
+        buffer._file = open(path, "rb")
+        buffer._path = path
+        buffer.size = os.fstat(buffer._file.fileno()).st_size
+        return buffer
+
+    @property
+    def in_memory(self):
+        return self._file is None
+
+    def write(self, data):
+        if self._file is None and self.size + len(data) > self.memory_limit:
+            os.makedirs("temp", exist_ok=True)
+            self._file = tempfile.TemporaryFile(dir="temp")
+            self._file.write(self._memory.getbuffer())
+            self._memory = None
+        (self._file or self._memory).write(data)
+        self.size += len(data)
+        return len(data)
+
+    def open_range(self, offset, length):
+        length = max(0, min(length, self.size - offset))
+        if self._file is None:
+            return MemoryPartReader(self._memory.getbuffer()[offset:offset + length])
+        self._file.flush()
+        return FilePartReader(self._file.fileno(), offset, length)
+
+    def acquire(self):
+        if self._closed:
+            return False
+        self._users += 1
+        return True
+
+    def close(self):
+        self._users -= 1
+        if self._users > 0 or self._closed:
+            return
+        self._closed = True
+        if self._file is not None:
+            self._file.close()
+        if self._path is not None:
+            os.remove(self._path)
+        self._memory = None
+
+
+class CachedPayload:
+    """A cached manifest zip opened for reading, with the same interface as DownloadBuffer."""
+
+    def __init__(self, path):
+        self._fd = os.open(path, os.O_RDONLY)
+        self.size = os.fstat(self._fd).st_size
+
+    def open_range(self, offset, length):
+        return FilePartReader(self._fd, offset, max(0, min(length, self.size - offset)))
+
+    def close(self):
+        os.close(self._fd)
+
+
+# Content-addressed local copy of recently served manifests, evicted least recently used first
+CACHE_DIR = "cache"
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+
+class ManifestCache:
+    def __init__(self, directory=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # The directory is only created by the first write; partial files left by an
+        # interrupted download or copy are removed here
+        existing = []
+        for name in os.listdir(directory) if os.path.isdir(directory) else []:
+            path = os.path.join(directory, name)
+            if name.endswith(".zip"):
+                stat = os.stat(path)
+                existing.append((stat.st_mtime, name[:-4], stat.st_size))
+            elif name.endswith(".tmp"):
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    logging.warning(f"Could not remove partial cache file {name}: {e}")
+        for _, key, size in sorted(existing):
+            self._entries[key] = size
+            self.total_bytes += size
+
+    @staticmethod
+    def key_for(file):
+        key = file.get("md5Checksum") or f"{file['id']}-{file.get('modifiedTime', '')}"
+        return re.sub(r"[^A-Za-z0-9_.-]", "_", key)
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.zip")
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def temp_file(self):
+        """``(fd, path)`` of a new file in the cache directory to write a manifest into."""
+        os.makedirs(self.directory, exist_ok=True)
+        return tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+
+    def put(self, key, buffer):
+        if buffer.size > self.max_bytes:
+            return None
+        fd, tmp_path = self.temp_file()
+        with os.fdopen(fd, "wb") as f, buffer.open_range(0, buffer.size) as reader:
+            shutil.copyfileobj(reader, f, ATTACHMENT_SIZE)
+        return self.adopt(key, tmp_path, buffer.size)
+
+    def adopt(self, key, tmp_path, size):
+        """Move a file written in this cache's directory into the cache under ``key``."""
+        if size > self.max_bytes:
+            return None
+        path = self.path(key)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self.total_bytes += size - self._entries.pop(key, 0)
+            self._entries[key] = size
+            while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+                old_key, old_size = self._entries.popitem(last=False)
+                self.total_bytes -= old_size
+                try:
+                    os.remove(self.path(old_key))
+                except OSError as e:
+                    logging.warning(f"Could not evict cached manifest {old_key}: {e}")
+        return path
+
+
+manifest_cache = ManifestCache()
+# Downloads currently in progress, keyed by cache key, so concurrent requests share one transfer
+inflight_downloads = {}
+
+
+def _download_to_buffer(service, file_id, buffer):
+    request = service.files().get_media(fileId=file_id)
+    downloader = MediaIoBaseDownload(buffer, request)
+    done = False
+    while not done:
+        with span("drive media chunk"):
+            status, done = scheduler.call(downloader.next_chunk)
+        logging.info(f"Download progress: {int(status.progress() * 100)}%")
+
+
+async def _download_to_cache(file, key):
+    fd, path = manifest_cache.temp_file()
+    os.close(fd)
     try:
-        logging.info(f"Downloading file: {file_name} (ID: {file_id})")
-        request = service.files().get_media(fileId=file_id)
-        download_path = os.path.join("temp", file_name)
-        os.makedirs("temp", exist_ok=True)
-
-        with open(download_path, "wb") as f:
-            downloader = MediaIoBaseDownload(f, request)
-            done = False
-            while not done:
-                status, done = downloader.next_chunk()
-                logging.info(f"Download progress: {int(status.progress() * 100)}%")
-
-        logging.info(f"File downloaded successfully: {download_path}")
-        return download_path
+        logging.info(f"Downloading file in a worker: {file['name']} (ID: {file['id']})")
+        with stage("download"):
+            size = await file_pool.run(download_to_path, file["id"], path)
     except Exception as e:
-        logging.error(f"Error downloading file '{file_name}': {e}")
+        logging.error(f"Error downloading file '{file['name']}': {e}")
+        STAGE_ERRORS.inc(stage="download")
+        os.remove(path)
         return None
+    TRANSFER_BYTES.inc(size, direction="drive_download")
+    # Written straight into the cache directory, so caching it is only a rename
+    return manifest_cache.adopt(key, path, size) or DownloadBuffer.from_file(path)
 
 
-async def fetch_manifest_file(service, game_id):
+async def _download_and_cache(file, key):
+    if file_pool is not None:
+        return await _download_to_cache(file, key)
+    buffer = await download_file(file["id"], file["name"])
+    if buffer is None:
+        return None
     try:
-        query = f"'{FOLDER_MANIFEST}' in parents and name='{game_id}.zip'"
-        logging.info(f"Searching for file in Google Drive with query: {query}")
-        results = service.files().list(q=query, fields="files(id, name)").execute()
-        files = results.get("files", [])
-        logging.info(f"Files found: {files}")
-        return files[0] if files else None
+        loop = asyncio.get_running_loop()
+        path = await loop.run_in_executor(drive_executor, manifest_cache.put, key, buffer)
     except Exception as e:
-        logging.error(f"Error fetching manifest file: {e}")
+        logging.error(f"Error caching manifest '{file['name']}': {e}")
+        path = None
+    if path:
+        buffer.close()
+        return path
+    # Too large to cache: waiters share the buffer, which is released by the last one to close it
+    return buffer
+
+
+async def fetch_manifest_payload(file):
+    key = manifest_cache.key_for(file)
+    while True:
+        path = manifest_cache.get(key)
+        if path:
+            logging.info(f"Serving {file['name']} from the local cache.")
+            return CachedPayload(path)
+        task = inflight_downloads.get(key)
+        if task is None:
+            task = asyncio.ensure_future(_download_and_cache(file, key))
+            inflight_downloads[key] = task
+            task.add_done_callback(lambda _: inflight_downloads.pop(key, None))
+        else:
+            logging.info(f"Joining in-flight download of {file['name']}.")
+        result = await asyncio.shield(task)
+        if result is None:
+            return None
+        if isinstance(result, str):
+            try:
+                return CachedPayload(result)
+            except OSError:
+                continue
+        if result.acquire():
+            return result
+
+
+async def download_file(file_id, file_name):
+    buffer = DownloadBuffer()
+    try:
+        logging.info(f"Downloading file: {file_name} (ID: {file_id})")
+        with stage("download"):
+            await run_drive(_download_to_buffer, file_id, buffer)
+        TRANSFER_BYTES.inc(buffer.size, direction="drive_download")
+        logging.info(f"File downloaded successfully: {file_name} ({buffer.size} bytes, in memory: {buffer.in_memory})")
+        return buffer
+    except Exception as e:
+        logging.error(f"Error downloading file '{file_name}': {e}")
+        STAGE_ERRORS.inc(stage="download")
+        buffer.close()
         return None
 
-def split_file(file_path, game_id, chunk_size=9 * 1024 * 1024):  
+
+async def fetch_manifest_file(game_id):
     try:
-        with open(file_path, "rb") as f:
-            chunk_number = 1
-            while True:
-                chunk_data = f.read(chunk_size)
-                if not chunk_data:
-                    break
-                chunk_path = os.path.join("temp", f"Part{chunk_number}_{game_id}.zip")
-                with open(chunk_path, "wb") as chunk_file:
-                    chunk_file.write(chunk_data)
-                yield chunk_path
-                chunk_number += 1
+        logging.info(f"Searching for file: {game_id}.zip")
+        file = await lookup_manifest(game_id)
+        logging.info(f"File found: {file}")
+        return file
     except Exception as e:
-        logging.error(f"Error splitting file: {e}")
+        logging.error(f"Error fetching manifest file: {e}")
+        STAGE_ERRORS.inc(stage="lookup")
         return None
 
+def split_file(buffer, game_id, chunk_size=ATTACHMENT_SIZE):
+    for chunk_number, offset in enumerate(range(0, buffer.size, chunk_size), start=1):
+        yield f"Part{chunk_number}_{game_id}.zip", buffer.open_range(offset, chunk_size)
+
+
+# Discord accepts up to 10 attachments per message within one request body
+ATTACHMENTS_PER_MESSAGE = 10
+MAX_REQUEST_SIZE = 25 * 1024 * 1024
+ATTACHMENT_OVERHEAD = 256 * 1024  # multipart framing and message content
+
+
+def attachment_limits(guild):
+    file_limit = guild.filesize_limit if guild else ATTACHMENT_SIZE + ATTACHMENT_OVERHEAD
+    return file_limit - ATTACHMENT_OVERHEAD, max(file_limit, MAX_REQUEST_SIZE) - ATTACHMENT_OVERHEAD
+
+
+def pack_attachments(part_sizes, message_limit):
+    messages = []
+    current, current_size = [], 0
+    for index, size in enumerate(part_sizes):
+        if current and (len(current) == ATTACHMENTS_PER_MESSAGE or current_size + size > message_limit):
+            messages.append(current)
+            current, current_size = [], 0
+        current.append(index)
+        current_size += size
+    if current:
+        messages.append(current)
+    return messages
+
+
+async def send_followup(interaction, *args, **kwargs):
+    attachments = len(kwargs.get("files") or ()) + ("file" in kwargs)
+    with span("discord followup", attachments=attachments):
+        return await interaction.followup.send(*args, **kwargs)
+
+
+async def deliver_file(interaction, buffer, file_name, game_id):
+    part_size, message_limit = attachment_limits(interaction.guild)
+    if buffer.size <= part_size:
+        with stage("discord_upload"):
+            await send_followup(
+                interaction,
+                f"File {file_name} downloaded successfully. Uploading to the server...",
+                file=discord.File(buffer.open_range(0, buffer.size), filename=file_name),
+                ephemeral=True
+            )
+        TRANSFER_BYTES.inc(buffer.size, direction="discord_upload")
+        return
+    offsets = range(0, buffer.size, part_size)
+    names = [f"Part{number}_{game_id}.zip" for number in range(1, len(offsets) + 1)]
+    sizes = [min(part_size, buffer.size - offset) for offset in offsets]
+    messages = pack_attachments(sizes, message_limit)
+    await send_followup(
+        interaction,
+        f"File {file_name} is too large ({buffer.size / 1024 / 1024:.2f} MB). "
+        f"Sending {len(names)} parts in {len(messages)} messages...",
+        ephemeral=True
+    )
+    # Sends go out back to back; discord.py paces them from the webhook bucket's rate-limit headers
+    while messages:
+        indexes = messages.pop(0)
+        try:
+            with stage("discord_upload"):
+                await send_followup(
+                    interaction,
+                    f"Uploading {', '.join(names[index] for index in indexes)}",
+                    files=[
+                        discord.File(buffer.open_range(offsets[index], part_size), filename=names[index])
+                        for index in indexes
+                    ],
+                    ephemeral=True
+                )
+            TRANSFER_BYTES.inc(sum(sizes[index] for index in indexes), direction="discord_upload")
+        except discord.HTTPException as e:
+            if e.status != 413 or len(indexes) == 1:
+                raise
+            # This guild's request limit is tighter than assumed: fall back to one part per message
+            messages[:0] = [[index] for index in indexes]
+
 
 async def download_from_github(sha, path, repo):
     url = f"https://raw.githubusercontent.com/{repo}/{sha}/{path}"
     try:
         r = await http_client.get(url, headers=GITHUB_HEADERS)
         if r.status_code == 200:
+            TRANSFER_BYTES.inc(len(r.content), direction="github_download")
             return r.content
         else:
             logging.error(f"Failed to download {path} from GitHub. Status code: {r.status_code}")
@@ -157,173 +783,265 @@ async def fetch_manifest_from_github(game_id):
         return None
     except Exception as e:
         logging.error(f"Error fetching from GitHub: {e}")
+        STAGE_ERRORS.inc(stage="github_fetch")
         return None
 
-def create_zip_file(game_id, files):
-    zip_path = os.path.join("temp", f"{game_id}.zip")
-    with zipfile.ZipFile(zip_path, "w") as zip_file:
-        for file_name, content in files:
-            zip_file.writestr(file_name, content)
-    return zip_path
-
-
-async def upload_to_google_drive(service, file_path, file_name):
+async def upload_to_google_drive(file_path, file_name):
     try:
-        file_metadata = {"name": file_name, "parents": [FOLDER_MANIFEST]}
-        media = MediaFileUpload(file_path, resumable=True)
-        file = service.files().create(body=file_metadata, media_body=media, fields="id").execute()
-        logging.info(f"File uploaded to Google Drive with ID: {file.get('id')}")
-        return file.get("id")
+        # The same blocking loop the file workers run, here on a drive_executor thread
+        metadata = await run_drive(upload_file, file_path, file_name, FOLDER_MANIFEST, priority=BACKGROUND)
+        TRANSFER_BYTES.inc(os.path.getsize(file_path), direction="drive_upload")
+        logging.info(f"File uploaded to Google Drive with ID: {metadata['id']}")
+        return metadata
     except Exception as e:
         logging.error(f"Error uploading file to Google Drive: {e}")
+        STAGE_ERRORS.inc(stage="drive_upload")
         return None
 
-@bot.tree.command(name="get_manifest", description="Get a game manifest by ID")
-@app_commands.describe(game_id="The ID of the game manifest to download")
-@commands.cooldown(1, 8, BucketType.user)  # 1 use per 8 seconds per user
-async def get_manifest(interaction: discord.Interaction, game_id: str):
+async def add_manifest_to_drive(game_id, manifest_files):
+    if file_pool is None:
+        with stage("zip"):
+            zip_path = create_zip_file(game_id, manifest_files)
+        with stage("drive_upload"):
+            metadata = await upload_to_google_drive(zip_path, f"{game_id}.zip")
+        if metadata:
+            os.remove(zip_path)
+        return metadata
     try:
+        # Zipping happens in the worker too, so it is timed as part of the upload stage
+        with stage("drive_upload"):
+            metadata, size = await file_pool.run(add_manifest, game_id, manifest_files, FOLDER_MANIFEST, priority=BACKGROUND)
+    except Exception as e:
+        logging.error(f"Error uploading file to Google Drive: {e}")
+        STAGE_ERRORS.inc(stage="drive_upload")
+        return None
+    TRANSFER_BYTES.inc(size, direction="drive_upload")
+    logging.info(f"File uploaded to Google Drive with ID: {metadata['id']}")
+    return metadata
 
-        if interaction.guild and interaction.guild.id not in OFFICIAL_SERVER_IDS:
-            if interaction.guild.id not in unauthorized_servers:
-                await interaction.response.send_message(
-                    "This bot is only for official use. Please join one of the official servers for support:\n"
-                    "https://discord.gg/3Tzh3uKzyb",
-                    ephemeral=False  
-                )
-                unauthorized_servers.add(interaction.guild.id)  
-            return 
-
-
-        if interaction.guild is None:
-            await interaction.response.send_message(
-                "Bot was made by a single developer. Please support their work and use it in the official server:\n"
-                "https://discord.gg/3Tzh3uKzyb",
-                ephemeral=True,  
-            )
-            return 
-
-    
-        await interaction.response.defer(ephemeral=True)
-
-        if not game_id.isdigit():
-            await interaction.followup.send("Invalid input. Please enter an integer value.", ephemeral=True)
+async def _get_manifest_job(interaction, game_id):
+    try:
+        if drive_unavailable():
+            await send_followup(interaction, "Google Drive is unavailable right now. Please try again in a few minutes.", ephemeral=True)
             return
-
-        service = authenticate_with_google_drive()
-        if not service:
-            await interaction.followup.send("Failed to authenticate with Google Drive.", ephemeral=True)
+        if not await ensure_drive_service():
+            await send_followup(interaction, "Failed to authenticate with Google Drive.", ephemeral=True)
             return
 
   
-        file = await fetch_manifest_file(service, game_id)
+        file = await fetch_manifest_file(game_id)
         if file:
 
-            await interaction.followup.send(f"Game ID {game_id} found: {file['name']}", ephemeral=False)
-            download_path = await download_file(service, file["id"], file["name"])
-            if download_path:
-                file_size = os.path.getsize(download_path)
-                if file_size > 9 * 1024 * 1024: 
-                    await interaction.followup.send(
-                        f"File {file['name']} is too large ({file_size / 1024 / 1024:.2f} MB). Splitting into chunks...",
-                        ephemeral=True
-                    )
-                    for chunk_path in split_file(download_path, game_id):
-                        await interaction.followup.send(
-                            f"Uploading chunk: {os.path.basename(chunk_path)}",
-                            file=discord.File(chunk_path),
-                            ephemeral=True
-                        )
-                        os.remove(chunk_path) 
-                        await asyncio.sleep(1)  
-                else:
-                    await interaction.followup.send(
-                        f"File {file['name']} downloaded successfully. Uploading to the server...",
-                        file=discord.File(download_path),
-                        ephemeral=True
-                    )
-                os.remove(download_path)  
+            await send_followup(interaction, f"Game ID {game_id} found: {file['name']}", ephemeral=False)
+            buffer = await fetch_manifest_payload(file)
+            if buffer:
+                try:
+                    await deliver_file(interaction, buffer, file["name"], game_id)
+                finally:
+                    buffer.close()
             else:
-                await interaction.followup.send(f"Failed to download {file['name']}.", ephemeral=True)
+                await send_followup(interaction, f"Failed to download {file['name']}.", ephemeral=True)
         else:
-            await interaction.followup.send(
+            await send_followup(
+                interaction,
                 f"Game ID {game_id} not found in the database. Use `/add_game {game_id}` to add it.",
                 ephemeral=True,
             )
     except Exception as e:
         logging.error(f"Error in get_manifest: {e}")
-        await interaction.followup.send("An error occurred while processing your request.", ephemeral=True)
+        await send_followup(interaction, "An error occurred while processing your request.", ephemeral=True)
 
-# Slash command to add a game
-@bot.tree.command(name="add_game", description="Add a game manifest to the database")
-@app_commands.describe(game_id="The ID of the game manifest to add")
-@commands.cooldown(1, 8, BucketType.user)  
-async def add_game(interaction: discord.Interaction, game_id: str):
+async def admit_job(interaction, command, job, *args):
+    queued = time.monotonic()
+    trace = current_trace()
+
+    async def run():
+        wait = time.monotonic() - queued
+        QUEUE_WAIT_SECONDS.observe(wait)
+        try:
+            with resume(trace), span("job", queue_wait_ms=round(wait * 1000, 3)), JOB_SECONDS.time(command=command):
+                await job(interaction, *args)
+        finally:
+            if trace:
+                trace.release()
+
+    if trace:
+        trace.hold()
     try:
-      
-        if interaction.guild and interaction.guild.id not in OFFICIAL_SERVER_IDS:
-            if interaction.guild.id not in unauthorized_servers:
+        position = admission.submit(interaction.user.id, interaction.guild.id, run)
+    except Rejected as e:
+        if trace:
+            trace.release()
+        COMMANDS.inc(command=command, outcome="rejected")
+        await send_followup(interaction, str(e), ephemeral=True)
+        return
+    COMMANDS.inc(command=command, outcome="queued" if position else "started")
+    if position:
+        await send_followup(
+            interaction,
+            f"You're #{position} in the queue. Estimated wait: about {admission.estimated_wait(position):.0f} seconds.",
+            ephemeral=True,
+        )
+
+@bot.tree.command(name="get_manifest", description="Get a game manifest by ID")
+@app_commands.describe(game_id="The ID of the game manifest to download")
+async def get_manifest(interaction: discord.Interaction, game_id: str):
+    with tracer.trace("get_manifest", game_id=game_id, user_id=interaction.user.id,
+                      guild_id=getattr(interaction.guild, "id", None)):
+        try:
+
+            if interaction.guild and interaction.guild.id not in OFFICIAL_SERVER_IDS:
+                if interaction.guild.id not in unauthorized_servers:
+                    await interaction.response.send_message(
+                        "This bot is only for official use. Please join one of the official servers for support:\n"
+                        "https://discord.gg/3Tzh3uKzyb",
+                        ephemeral=False  
+                    )
+                    unauthorized_servers.add(interaction.guild.id)  
+                return 
+
+
+            if interaction.guild is None:
                 await interaction.response.send_message(
-                    "This bot is only for official use. Please join one of the official servers for support:\n"
+                    "Bot was made by a single developer. Please support their work and use it in the official server:\n"
                     "https://discord.gg/3Tzh3uKzyb",
-                    ephemeral=False  
+                    ephemeral=True,  
                 )
-                unauthorized_servers.add(interaction.guild.id)  
-            return  
-
-        if interaction.guild is None:
-            await interaction.response.send_message(
-                "Bot was made by a single developer. Please support their work and use it in the official server:\n"
-                "",
-                ephemeral=True,  
-            )
-            return  
+                return 
 
-      
-        await interaction.response.defer(ephemeral=True)
+    
+            with span("discord defer"):
+                await interaction.response.defer(ephemeral=True)
 
-        if not game_id.isdigit():
-            await interaction.followup.send("Invalid input. Please enter an integer value.", ephemeral=True)
-            return
+            if not game_id.isdigit():
+                await send_followup(interaction, "Invalid input. Please enter an integer value.", ephemeral=True)
+                return
+
+            await admit_job(interaction, "get_manifest", _get_manifest_job, game_id)
+        except Exception as e:
+            logging.error(f"Error in get_manifest: {e}")
+            await send_followup(interaction, "An error occurred while processing your request.", ephemeral=True)
 
-        service = authenticate_with_google_drive()
-        if not service:
-            await interaction.followup.send("Failed to authenticate with Google Drive.", ephemeral=True)
+async def _add_game_job(interaction, game_id):
+    try:
+        if drive_unavailable():
+            await send_followup(interaction, "Google Drive is unavailable right now. Please try again in a few minutes.", ephemeral=True)
+            return
+        if not await ensure_drive_service():
+            await send_followup(interaction, "Failed to authenticate with Google Drive.", ephemeral=True)
             return
 
 
-        if await check_file_exists(service, game_id):
-            await interaction.followup.send(f"Game ID {game_id} already exists in the database.", ephemeral=True)
+        if await check_file_exists(game_id):
+            await send_followup(interaction, f"Game ID {game_id} already exists in the database.", ephemeral=True)
             return
 
-        manifest_files = await fetch_manifest_from_github(game_id)
+        with stage("github_fetch"):
+            manifest_files = await fetch_manifest_from_github(game_id)
         if not manifest_files:
-            await interaction.followup.send(f"Game ID {game_id} not found in any repository.", ephemeral=True)
+            await send_followup(interaction, f"Game ID {game_id} not found in any repository.", ephemeral=True)
             return
 
 
-        zip_path = create_zip_file(game_id, manifest_files)
-        if not zip_path:
-            await interaction.followup.send("Failed to create a zip file.", ephemeral=True)
-            return
-
-        file_name = f"{game_id}.zip"
-        file_id = await upload_to_google_drive(service, zip_path, file_name)
-        if not file_id:
-            await interaction.followup.send("Failed to upload the file to Google Drive.", ephemeral=True)
+        metadata = await add_manifest_to_drive(game_id, manifest_files)
+        if not metadata:
+            await send_followup(interaction, "Failed to upload the file to Google Drive.", ephemeral=True)
             return
+        manifest_index.add(metadata)
 
-        await interaction.followup.send(
+        await send_followup(
+            interaction,
             f"Game ID {game_id} has been added to the database. You can now use `/get_manifest {game_id}` to download it.",
             ephemeral=True,
         )
 
-
-        os.remove(zip_path)
-
     except Exception as e:
         logging.error(f"Error in add_game: {e}")
-        await interaction.followup.send("An error occurred while processing your request.", ephemeral=True)
+        await send_followup(interaction, "An error occurred while processing your request.", ephemeral=True)
+
+# Slash command to add a game
+@bot.tree.command(name="add_game", description="Add a game manifest to the database")
+@app_commands.describe(game_id="The ID of the game manifest to add")
+async def add_game(interaction: discord.Interaction, game_id: str):
+    with tracer.trace("add_game", game_id=game_id, user_id=interaction.user.id,
+                      guild_id=getattr(interaction.guild, "id", None)):
+        try:
+      
+            if interaction.guild and interaction.guild.id not in OFFICIAL_SERVER_IDS:
+                if interaction.guild.id not in unauthorized_servers:
+                    await interaction.response.send_message(
+                        "This bot is only for official use. Please join one of the official servers for support:\n"
+                        "https://discord.gg/3Tzh3uKzyb",
+                        ephemeral=False  
+                    )
+                    unauthorized_servers.add(interaction.guild.id)  
+                return  
+
+            if interaction.guild is None:
+                await interaction.response.send_message(
+                    "Bot was made by a single developer. Please support their work and use it in the official server:\n"
+                    "",
+                    ephemeral=True,  
+                )
+                return  
+
+      
+            with span("discord defer"):
+                await interaction.response.defer(ephemeral=True)
+
+            if not game_id.isdigit():
+                await send_followup(interaction, "Invalid input. Please enter an integer value.", ephemeral=True)
+                return
+
+            await admit_job(interaction, "add_game", _add_game_job, game_id)
+        except Exception as e:
+            logging.error(f"Error in add_game: {e}")
+            await send_followup(interaction, "An error occurred while processing your request.", ephemeral=True)
+
+
+# Interaction followups expire after 15 minutes, so a profile report is sent before then
+PROFILE_TIMEOUT = 14 * 60
+
+
+@bot.tree.command(name="trace_sampling", description="Set the share of requests that are traced (admins only)")
+@app_commands.describe(rate="Fraction of requests to trace, from 0 to 1")
+async def trace_sampling(interaction: discord.Interaction, rate: app_commands.Range[float, 0.0, 1.0]):
+    if interaction.user.id not in ADMIN_USER_IDS:
+        await interaction.response.send_message("This command is for bot admins only.", ephemeral=True)
+        return
+    tracer.sample_rate = rate
+    await interaction.response.send_message(f"Tracing {rate:.0%} of requests to `{tracer.path}`.", ephemeral=True)
+
+
+@bot.tree.command(name="profile", description="Profile the next requests and report the hot path (admins only)")
+@app_commands.describe(requests="How many requests to profile", mode="Which profiler to run")
+@app_commands.choices(mode=[
+    app_commands.Choice(name="sampling (all threads)", value="sampling"),
+    app_commands.Choice(name="cProfile (event loop only)", value="cprofile"),
+])
+async def profile(interaction: discord.Interaction, requests: app_commands.Range[int, 1, 100], mode: str = "sampling"):
+    if interaction.user.id not in ADMIN_USER_IDS:
+        await interaction.response.send_message("This command is for bot admins only.", ephemeral=True)
+        return
+    await interaction.response.defer(ephemeral=True)
+    done = tracer.profile_next(requests, mode)
+    session = tracer.profile_session
+    try:
+        report = await asyncio.wait_for(asyncio.shield(done), PROFILE_TIMEOUT)
+    except asyncio.TimeoutError:
+        session.finish()
+        report = await done
+    if file_pool is not None:
+        # Profilers only see this process; worker jobs show up as spans in the traces instead
+        report += (
+            "\n\nNot profiled: Drive transfers and zip building run in file worker processes. "
+            "Their Drive calls are recorded as spans under each request's trace.\n"
+        )
+    await interaction.followup.send(
+        f"Profile of up to {requests} requests ({mode}):",
+        file=discord.File(io.BytesIO(report.encode("utf-8")), filename="profile.txt"),
+        ephemeral=True,
+    )
 
 @bot.event
 async def on_message(message):
@@ -369,9 +1087,22 @@ async def test(ctx):
 
 @bot.event
 async def on_ready():
+    if not await ensure_drive_service():
+        logging.error("Drive service pool could not be initialised; commands will retry on demand.")
+    if not manifest_index_sync_loop.is_running():
+        manifest_index_sync_loop.start()
+    admission.start()
+    start_file_workers()
+    try:
+        await start_metrics_server()
+    except OSError as e:
+        logging.error(f"Could not start the metrics endpoint: {e}")
     await bot.tree.sync()
     logging.info(f"Logged in as {bot.user.name}")
 
-# Run the bot
-if __name__ == "__main__":
+def main():
     bot.run("")  # Replace with your actual bot token
+
+# Run the bot (run_bot.py does the same without making file workers re-import this module)
+if __name__ == "__main__":
+    main()
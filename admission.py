@@ -0,0 +1,155 @@
+import asyncio
+import logging
+import math
+import time
+from collections import Counter
+
+
+USER_CONCURRENCY = 1
+GUILD_CONCURRENCY = 4
+# Token buckets: sustained jobs per second and the burst allowed on top of it
+USER_RATE = 1 / 8
+USER_BURST = 2
+GUILD_RATE = 1 / 2
+GUILD_BURST = 10
+QUEUE_SIZE = 50
+QUEUE_WORKERS = 4
+# Starting guess for one job's duration until real jobs have been timed
+INITIAL_JOB_SECONDS = 15.0
+JOB_SECONDS_SMOOTHING = 0.2
+# Idle buckets are dropped once this many have accumulated
+MAX_IDLE_BUCKETS = 1024
+
+
+class Rejected(Exception):
+    """Raised when a job is not admitted; the message is meant for the user."""
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def retry_after(self):
+        self._refill()
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    @property
+    def full(self):
+        self._refill()
+        return self.tokens >= self.burst
+
+
+class AdmissionController:
+    """Admits slash-command jobs per user and guild and runs them from one bounded queue.
+
+    A job is rejected when its user or guild already has too many jobs queued or running,
+    when their token bucket is empty, or when the queue is full. Admitted jobs are run by
+    a fixed number of worker tasks, so a spike queues up instead of starting unbounded
+    downloads at once.
+    """
+
+    def __init__(self, workers=QUEUE_WORKERS, queue_size=QUEUE_SIZE,
+                 user_concurrency=USER_CONCURRENCY, guild_concurrency=GUILD_CONCURRENCY,
+                 user_rate=USER_RATE, user_burst=USER_BURST, guild_rate=GUILD_RATE, guild_burst=GUILD_BURST):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.user_concurrency = user_concurrency
+        self.guild_concurrency = guild_concurrency
+        self.user_limits = (user_rate, user_burst)
+        self.guild_limits = (guild_rate, guild_burst)
+        self.queue = None
+        self.running = 0
+        self.job_seconds = INITIAL_JOB_SECONDS
+        self._user_jobs = Counter()
+        self._guild_jobs = Counter()
+        self._user_buckets = {}
+        self._guild_buckets = {}
+        self._tasks = []
+
+    def start(self):
+        # The queue and workers belong to the running event loop, so they are created lazily
+        if self._tasks:
+            return
+        self.queue = asyncio.Queue(self.queue_size)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    @property
+    def depth(self):
+        return self.queue.qsize() if self.queue else 0
+
+    def _bucket(self, buckets, key, limits):
+        bucket = buckets.get(key)
+        if bucket is None:
+            if len(buckets) >= MAX_IDLE_BUCKETS:
+                self._prune(buckets)
+            bucket = buckets[key] = TokenBucket(*limits)
+        return bucket
+
+    @staticmethod
+    def _prune(buckets):
+        for key in [key for key, bucket in buckets.items() if bucket.full]:
+            del buckets[key]
+
+    def submit(self, user_id, guild_id, job):
+        """Queue ``job`` (a coroutine function) or raise Rejected.
+
+        Returns the job's position in the queue, 0 when a worker picks it up right away.
+        """
+        self.start()
+        if self._user_jobs[user_id] >= self.user_concurrency:
+            raise Rejected("You already have a request in progress. Please wait for it to finish.")
+        if guild_id is not None and self._guild_jobs[guild_id] >= self.guild_concurrency:
+            raise Rejected("This server has too many requests in progress. Please try again shortly.")
+        buckets = [self._bucket(self._user_buckets, user_id, self.user_limits)]
+        if guild_id is not None:
+            buckets.append(self._bucket(self._guild_buckets, guild_id, self.guild_limits))
+        wait = max(bucket.retry_after() for bucket in buckets)
+        if wait > 0:
+            raise Rejected(f"You're sending requests too quickly. Try again in {math.ceil(wait)} seconds.")
+        if self.queue.full():
+            raise Rejected("The bot is busy right now. Please try again in a minute.")
+        for bucket in buckets:
+            bucket.take()
+        self._user_jobs[user_id] += 1
+        if guild_id is not None:
+            self._guild_jobs[guild_id] += 1
+        self.queue.put_nowait((user_id, guild_id, job))
+        return max(0, self.queue.qsize() - (self.workers - self.running))
+
+    def estimated_wait(self, position):
+        return math.ceil(position / self.workers) * self.job_seconds
+
+    def _release(self, user_id, guild_id):
+        self._user_jobs[user_id] -= 1
+        if self._user_jobs[user_id] <= 0:
+            del self._user_jobs[user_id]
+        if guild_id is not None:
+            self._guild_jobs[guild_id] -= 1
+            if self._guild_jobs[guild_id] <= 0:
+                del self._guild_jobs[guild_id]
+
+    async def _worker(self):
+        while True:
+            user_id, guild_id, job = await self.queue.get()
+            self.running += 1
+            started = time.monotonic()
+            try:
+                await job()
+            except Exception as e:
+                logging.error(f"Queued job for user {user_id} failed: {e}")
+            finally:
+                self.running -= 1
+                self._release(user_id, guild_id)
+                self.job_seconds += JOB_SECONDS_SMOOTHING * (time.monotonic() - started - self.job_seconds)
+                self.queue.task_done()
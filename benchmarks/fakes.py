@@ -0,0 +1,371 @@
+"""In-process stand-ins for Google Drive, GitHub and Discord used by the benchmarks.
+
+They implement just the calls this repository makes, with configurable latency and
+bandwidth, so the real pipeline code runs unchanged against them.
+"""
+import asyncio
+import hashlib
+import itertools
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+import httplib2
+import httpx
+from googleapiclient.http import MediaUploadProgress
+
+
+NAME_CLAUSE = re.compile(r"name\s*(=|contains)\s*'((?:[^'\\]|\\.)*)'")
+PARENT_CLAUSE = re.compile(r"'((?:[^'\\]|\\.)*)'\s+in\s+parents")
+
+
+def _unquote(value):
+    return re.sub(r"\\(.)", r"\1", value)
+
+
+class SyntheticContent:
+    """``size`` bytes, distinct per ``seed``, generated on read instead of held in memory.
+
+    Lets a load test publish a large catalogue without allocating every file up front.
+    """
+
+    BLOCK = os.urandom(64 * 1024)
+
+    def __init__(self, seed, size):
+        self.prefix = hashlib.sha256(str(seed).encode()).digest()
+        self.size = size
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, key):
+        start, stop, _ = key.indices(self.size)
+        parts = []
+        if start < len(self.prefix):
+            parts.append(self.prefix[start:stop])
+            start = len(self.prefix)
+        while start < stop:
+            offset = (start - len(self.prefix)) % len(self.BLOCK)
+            length = min(len(self.BLOCK) - offset, stop - start)
+            parts.append(self.BLOCK[offset:offset + length])
+            start += length
+        return b"".join(parts)
+
+    def md5(self):
+        digest = hashlib.md5()
+        for start in range(0, self.size, 1024 * 1024):
+            digest.update(self[start:start + 1024 * 1024])
+        return digest.hexdigest()
+
+
+class FakeRequest:
+    def __init__(self, drive, action):
+        self._drive = drive
+        self._action = action
+
+    def execute(self, http=None, num_retries=0):
+        self._drive.wait()
+        return self._action()
+
+
+class FakeMediaHttp:
+    """Answers the ranged GETs MediaIoBaseDownload sends."""
+
+    def __init__(self, drive, file_id):
+        self._drive = drive
+        self._file_id = file_id
+
+    def request(self, uri, method="GET", headers=None, **kwargs):
+        content = self._drive.content[self._file_id]
+        start, end = map(int, headers["range"][len("bytes="):].split("-"))
+        chunk = content[start:end + 1]
+        self._drive.wait(len(chunk))
+        response = httplib2.Response({"status": 206, "content-range": f"bytes {start}-{start + len(chunk) - 1}/{len(content)}"})
+        return response, chunk
+
+
+class FakeMediaRequest(FakeRequest):
+    def __init__(self, drive, file_id):
+        super().__init__(drive, lambda: drive.content[file_id][:])
+        self.uri = f"fake://drive/{file_id}?alt=media"
+        self.headers = {}
+        self.http = FakeMediaHttp(drive, file_id)
+
+
+class FakeUploadRequest:
+    """Resumable upload driven by next_chunk(), honouring the media's current chunk size."""
+
+    def __init__(self, drive, body, media):
+        self._drive = drive
+        self._body = body
+        self._media = media
+        self.resumable_progress = 0
+        self.resumable_uri = None
+        self._in_error_state = False
+
+    def next_chunk(self, http=None, num_retries=0):
+        size = self._media.size()
+        chunk = self._media.getbytes(self.resumable_progress, self._media.chunksize())
+        self._drive.wait(len(chunk))
+        self.resumable_uri = self.resumable_uri or f"fake://upload/{id(self)}"
+        self.resumable_progress += len(chunk)
+        if self.resumable_progress < size:
+            return MediaUploadProgress(self.resumable_progress, size), None
+        return None, self._drive.add_file(self._body["name"], self._media.getbytes(0, size), self._body["parents"][0])
+
+    def execute(self, http=None, num_retries=0):
+        response = None
+        while response is None:
+            _, response = self.next_chunk()
+        return response
+
+
+class _Files:
+    def __init__(self, drive):
+        self._drive = drive
+
+    def list(self, q="", fields=None, pageSize=100, pageToken=None, orderBy=None, **kwargs):
+        return FakeRequest(self._drive, lambda: self._drive.list(q, pageSize, pageToken, orderBy))
+
+    def get(self, fileId, fields=None, **kwargs):
+        return FakeRequest(self._drive, lambda: self._drive.metadata(fileId))
+
+    def get_media(self, fileId, **kwargs):
+        return FakeMediaRequest(self._drive, fileId)
+
+    def create(self, body, media_body=None, fields=None, **kwargs):
+        if media_body is not None and media_body.resumable():
+            return FakeUploadRequest(self._drive, body, media_body)
+        content = media_body.getbytes(0, media_body.size()) if media_body is not None else b""
+        return FakeRequest(self._drive, lambda: self._drive.add_file(body["name"], content, body["parents"][0]))
+
+    def update(self, fileId, media_body=None, **kwargs):
+        return FakeRequest(self._drive, lambda: self._drive.replace(fileId, media_body.getbytes(0, media_body.size())))
+
+    def delete(self, fileId, **kwargs):
+        return FakeRequest(self._drive, lambda: self._drive.remove(fileId))
+
+
+class _Changes:
+    def __init__(self, drive):
+        self._drive = drive
+
+    def getStartPageToken(self, **kwargs):
+        return FakeRequest(self._drive, lambda: {"startPageToken": str(len(self._drive.change_log))})
+
+    def list(self, pageToken, **kwargs):
+        return FakeRequest(self._drive, lambda: self._drive.changes_since(int(pageToken)))
+
+
+class FakeDrive:
+    """Drive v3 service stand-in: files().list/get/get_media/create/update/delete and changes().
+
+    ``latency`` is added to every request and ``bandwidth`` (bytes per second) to every
+    media transfer. Calls block the calling thread, like the real client.
+    """
+
+    def __init__(self, latency=0.0, bandwidth=None):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.files_by_id = {}
+        self.content = {}
+        self.change_log = []
+        self.requests = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state["_lock"], state["_ids"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        # Past every ID the original handed out, so a copy's new files never collide with them
+        self._ids = itertools.count(len(self.change_log) + 1)
+
+    def service(self):
+        """FileWorkerPool service_factory: each worker unpickles its own copy of this drive."""
+        return self
+
+    def files(self):
+        return _Files(self)
+
+    def changes(self):
+        return _Changes(self)
+
+    def wait(self, transferred=0):
+        with self._lock:
+            self.requests += 1
+        delay = self.latency + (transferred / self.bandwidth if self.bandwidth else 0)
+        if delay:
+            time.sleep(delay)
+
+    def add_file(self, name, content, parent=""):
+        if isinstance(content, int):
+            content = os.urandom(content)
+        with self._lock:
+            file_id = f"file{next(self._ids)}"
+            self.files_by_id[file_id] = {
+                "id": file_id,
+                "name": name,
+                "size": str(len(content)),
+                "md5Checksum": content.md5() if isinstance(content, SyntheticContent) else hashlib.md5(content).hexdigest(),
+                "modifiedTime": datetime.now(timezone.utc).isoformat(),
+                "parents": [parent],
+            }
+            self.content[file_id] = content
+            self.change_log.append({"fileId": file_id, "removed": False, "file": dict(self.files_by_id[file_id], trashed=False)})
+        return self.metadata(file_id)
+
+    def replace(self, file_id, content):
+        with self._lock:
+            self.content[file_id] = content
+            self.files_by_id[file_id].update(size=str(len(content)), md5Checksum=hashlib.md5(content).hexdigest())
+        return self.metadata(file_id)
+
+    def remove(self, file_id):
+        with self._lock:
+            self.files_by_id.pop(file_id, None)
+            self.content.pop(file_id, None)
+            self.change_log.append({"fileId": file_id, "removed": True})
+        return ""
+
+    def metadata(self, file_id):
+        return {key: value for key, value in self.files_by_id[file_id].items() if key != "parents"}
+
+    def list(self, q, page_size, page_token, order_by):
+        parents = {_unquote(value) for value in PARENT_CLAUSE.findall(q)}
+        exact = {_unquote(value) for op, value in NAME_CLAUSE.findall(q) if op == "="}
+        contains = [_unquote(value) for op, value in NAME_CLAUSE.findall(q) if op == "contains"]
+        with self._lock:
+            files = [
+                file for file in self.files_by_id.values()
+                if (not parents or parents & set(file["parents"]))
+                and (not exact or file["name"] in exact)
+                and all(part in file["name"] for part in contains)
+            ]
+        if order_by == "name":
+            files.sort(key=lambda file: file["name"])
+        start = int(page_token or 0)
+        page = [self.metadata(file["id"]) for file in files[start:start + page_size]]
+        result = {"files": page}
+        if start + page_size < len(files):
+            result["nextPageToken"] = str(start + page_size)
+        return result
+
+    def changes_since(self, token):
+        with self._lock:
+            return {"changes": self.change_log[token:], "newStartPageToken": str(len(self.change_log))}
+
+
+class FakeCredentials:
+    valid = True
+    token = "fake-token"
+    expiry = None
+
+    def refresh(self, request):
+        pass
+
+    def before_request(self, request, method, url, headers):
+        headers["authorization"] = f"Bearer {self.token}"
+
+
+class FakeServicePool:
+    """Drop-in for Bot.DriveServicePool that hands out one shared FakeDrive."""
+
+    def __init__(self, drive):
+        self.drive = drive
+        self.credentials = FakeCredentials()
+
+    def refresh_if_needed(self):
+        pass
+
+    def get(self):
+        return self.drive
+
+    def stats(self):
+        return {}
+
+
+class FakeGitHub:
+    """Answers the branch, tree and raw-file requests fetch_manifest_from_github makes.
+
+    Every numeric branch exists and holds the same set of files with the given sizes.
+    """
+
+    def __init__(self, files, latency=0.0):
+        self.latency = latency
+        self.files = {path: os.urandom(size) for path, size in files.items()}
+        self.requests = 0
+
+    async def handle(self, request):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        parts = request.url.path.strip("/").split("/")
+        if request.url.host == "raw.githubusercontent.com":
+            content = self.files.get("/".join(parts[3:]))
+            return httpx.Response(200, content=content) if content is not None else httpx.Response(404)
+        repo = "/".join(parts[1:3])
+        if parts[3] == "branches":
+            sha = hashlib.sha1(parts[4].encode()).hexdigest()
+            tree_url = f"https://api.github.com/repos/{repo}/git/trees/{sha}"
+            return httpx.Response(200, json={"commit": {"sha": sha, "commit": {"tree": {"url": tree_url}}}})
+        if parts[3:5] == ["git", "trees"]:
+            return httpx.Response(200, json={"tree": [{"path": path} for path in self.files]})
+        return httpx.Response(404)
+
+    def client(self):
+        return httpx.AsyncClient(transport=httpx.MockTransport(self.handle))
+
+
+class FakeFollowup:
+    def __init__(self, latency):
+        self.latency = latency
+        self.messages = []
+        self.attachment_bytes = 0
+
+    async def send(self, content=None, *, file=None, files=None, ephemeral=False, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        for attachment in ([file] if file else []) + list(files or []):
+            self.attachment_bytes += len(attachment.fp.read())
+            attachment.close()
+        self.messages.append(content)
+
+
+class FakeResponse:
+    def __init__(self, latency):
+        self.latency = latency
+        self.messages = []
+
+    async def defer(self, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def send_message(self, content=None, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.messages.append(content)
+
+
+class FakeInteraction:
+    """discord.Interaction stand-in with the attributes the slash-command handlers use."""
+
+    def __init__(self, user_id, guild_id, filesize_limit=10 * 1024 * 1024, latency=0.0):
+        self.user = SimpleNamespace(id=user_id)
+        self.guild = SimpleNamespace(id=guild_id, filesize_limit=filesize_limit)
+        self.response = FakeResponse(latency)
+        self.followup = FakeFollowup(latency)
+
+    def failed(self):
+        failures = ("error occurred", "Failed", "not found", "already exists", "busy", "too quickly", "unavailable")
+        return any(failure in str(message) for message in self.followup.messages for failure in failures)
+
+    def transcript(self):
+        return json.dumps(self.response.messages + self.followup.messages)
@@ -0,0 +1,281 @@
+"""Closed-loop load test of the /get_manifest and /add_game handlers against in-process fakes.
+
+    python benchmarks/load.py                                  # 1..400 users, Zipf-popular IDs
+    python benchmarks/load.py --distribution uniform --concurrency 50,100
+    python benchmarks/load.py --sizes 256K:50,32M:50 --add-ratio 0.3 --json
+
+Each simulated user sends a command, waits for its job to finish, thinks, and repeats.
+For every concurrency level the bot is rewired to a fresh fake Drive, index and cache,
+and the report gives one row of the saturation curve: completed requests per second,
+end-to-end latency percentiles, rejections, event-loop lag, disk growth and RSS.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import shutil
+import sys
+import time
+from bisect import bisect_left
+
+from run import Environment, GUILD_ID, SPLIT_FILESIZE_LIMIT, percentile
+from fakes import FakeInteraction, SyntheticContent
+from admission import AdmissionController, QUEUE_SIZE, QUEUE_WORKERS, Rejected
+from drive_scheduler import REQUESTS_PER_SECOND, scheduler
+from file_worker import FILE_WORKERS
+
+
+LAG_INTERVAL = 0.05
+SAMPLE_INTERVAL = 0.25
+SIZE_UNITS = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+
+class TrackedAdmission(AdmissionController):
+    """AdmissionController that lets each simulated user await the job it just submitted."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.completions = {}
+
+    def submit(self, user_id, guild_id, job):
+        done = asyncio.get_running_loop().create_future()
+
+        async def tracked():
+            try:
+                await job()
+            finally:
+                done.set_result(None)
+
+        try:
+            position = super().submit(user_id, guild_id, tracked)
+        except Rejected:
+            self.completions[user_id] = None
+            raise
+        self.completions[user_id] = done
+        return position
+
+
+class IdPicker:
+    """Draws catalogue IDs either uniformly or with Zipf popularity (rank r has weight 1/r^s)."""
+
+    def __init__(self, ids, distribution, exponent, rng):
+        self.ids = ids
+        self.rng = rng
+        weights = [1.0] * len(ids) if distribution == "uniform" else [1 / rank ** exponent for rank in range(1, len(ids) + 1)]
+        self.cumulative = list(itertools.accumulate(weights))
+
+    def pick(self):
+        return self.ids[bisect_left(self.cumulative, self.rng.random() * self.cumulative[-1])]
+
+
+def parse_size(text):
+    text = text.strip().upper().rstrip("B").rstrip("I")
+    if text[-1:] in SIZE_UNITS:
+        return int(float(text[:-1]) * SIZE_UNITS[text[-1]])
+    return int(text)
+
+
+def parse_mix(text):
+    """``"256K:70,4M:25,24M:5"`` -> ([262144, 4194304, 25165824], [70.0, 25.0, 5.0])"""
+    sizes, weights = [], []
+    for item in text.split(","):
+        size, _, weight = item.partition(":")
+        sizes.append(parse_size(size))
+        weights.append(float(weight or 1))
+    return sizes, weights
+
+
+class Sampler:
+    """Samples event-loop lag, disk use under ``path`` and RSS while a level runs."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lags = []
+        self.disk_start = self._disk_used()
+        self.disk_peak = 0
+        self.rss_peak = 0
+        self._tasks = []
+
+    def _disk_used(self):
+        # Only the bot's own files (cache/, temp/, indexes), not the whole filesystem
+        total = 0
+        for root, _, files in os.walk(self.path):
+            for name in files:
+                try:
+                    total += os.stat(os.path.join(root, name)).st_size
+                except OSError:
+                    continue  # removed between listing and stat
+        return total
+
+    @staticmethod
+    def _rss():
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError):
+            return 0
+
+    async def _lag(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(LAG_INTERVAL)
+            self.lags.append(time.perf_counter() - started - LAG_INTERVAL)
+
+    async def _resources(self):
+        while True:
+            # Walking the tree blocks, so it runs off the loop to keep it out of the lag samples
+            disk_used = await asyncio.to_thread(self._disk_used)
+            self.disk_peak = max(self.disk_peak, disk_used - self.disk_start)
+            self.rss_peak = max(self.rss_peak, self._rss())
+            await asyncio.sleep(SAMPLE_INTERVAL)
+
+    def start(self):
+        self._tasks = [asyncio.ensure_future(self._lag()), asyncio.ensure_future(self._resources())]
+
+    def stop(self):
+        for task in self._tasks:
+            task.cancel()
+
+
+async def user_loop(env, bot, user_id, picker, new_ids, deadline, results, rng):
+    args = env.args
+    while time.perf_counter() < deadline:
+        if rng.random() < args.add_ratio:
+            command, handler, game_id = "add_game", bot.add_game, next(new_ids)
+        else:
+            command, handler, game_id = "get_manifest", bot.get_manifest, picker.pick()
+        interaction = FakeInteraction(user_id, GUILD_ID, args.filesize_limit, latency=args.discord_latency)
+        started = time.perf_counter()
+        await handler.callback(interaction, str(game_id))
+        submitted = user_id in bot.admission.completions
+        completion = bot.admission.completions.pop(user_id, None)
+        if not submitted:
+            outcome = "failed"
+        elif completion is None:
+            outcome = "rejected"
+        else:
+            await completion
+            outcome = "failed" if interaction.failed() else "ok"
+        results.append((command, outcome, time.perf_counter() - started))
+        if args.think_time:
+            await asyncio.sleep(rng.expovariate(1 / args.think_time))
+
+
+async def run_level(env, concurrency, catalogue):
+    args = env.args
+    drive = env.drive()
+    bot = env.bot
+    for game_id, size in catalogue:
+        drive.add_file(f"{game_id}.zip", SyntheticContent(game_id, size), bot.FOLDER_MANIFEST)
+    if args.production_limits:
+        admission = TrackedAdmission(workers=args.workers, queue_size=args.queue_size)
+    else:
+        admission = TrackedAdmission(
+            workers=args.workers, queue_size=args.queue_size,
+            user_rate=1e9, user_burst=1e9, guild_rate=1e9, guild_burst=1e9, guild_concurrency=10 ** 9,
+        )
+    bot = env.wire_bot(drive, admission)
+    env.start_file_workers(bot, drive)
+    await bot.sync_manifest_index()
+
+    rng = random.Random(args.seed)
+    picker = IdPicker([game_id for game_id, _ in catalogue], args.distribution, args.zipf, rng)
+    new_ids = itertools.count(10 ** 9)
+    results = []
+    sampler = Sampler(env.workdir)
+    sampler.start()
+    started = time.perf_counter()
+    deadline = started + args.duration
+    await asyncio.gather(*(
+        user_loop(env, bot, user_id, picker, new_ids, deadline, results, random.Random(args.seed + user_id))
+        for user_id in range(1, concurrency + 1)
+    ))
+    elapsed = time.perf_counter() - started
+    sampler.stop()
+
+    latencies = [latency for _, outcome, latency in results if outcome == "ok"]
+    counts = {outcome: sum(1 for _, o, _ in results if o == outcome) for outcome in ("ok", "rejected", "failed")}
+    return {
+        "concurrency": concurrency,
+        "requests": len(results),
+        **counts,
+        "throughput_per_second": round(counts["ok"] / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1) if latencies else None,
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1) if latencies else None,
+        "loop_lag_p99_ms": round(percentile(sampler.lags, 0.99) * 1000, 1) if sampler.lags else None,
+        "loop_lag_max_ms": round(max(sampler.lags) * 1000, 1) if sampler.lags else None,
+        "disk_peak_mb": round(sampler.disk_peak / 1024 ** 2, 1),
+        "rss_peak_mb": round(sampler.rss_peak / 1024 ** 2, 1),
+        "cache_hit_ratio": round(bot.manifest_cache.hits / max(1, bot.manifest_cache.hits + bot.manifest_cache.misses), 3),
+    }
+
+
+def print_curve(rows):
+    columns = (
+        ("concurrency", "users"), ("requests", "reqs"), ("ok", "ok"), ("rejected", "rej"), ("failed", "fail"),
+        ("throughput_per_second", "ok/s"), ("p50_ms", "p50 ms"), ("p95_ms", "p95 ms"), ("p99_ms", "p99 ms"),
+        ("loop_lag_p99_ms", "lag p99"), ("loop_lag_max_ms", "lag max"), ("disk_peak_mb", "disk MB"),
+        ("rss_peak_mb", "RSS MB"), ("cache_hit_ratio", "hit%"),
+    )
+    print(" ".join(f"{title:>9}" for _, title in columns))
+    for row in rows:
+        print(" ".join(f"{'-' if row[key] is None else row[key]:>9}" for key, _ in columns))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Saturation curve for the slash-command pipeline")
+    parser.add_argument("--concurrency", default="1,10,50,100,200,400", help="Comma-separated simulated user counts")
+    parser.add_argument("--duration", type=float, default=15.0, help="Seconds per concurrency level")
+    parser.add_argument("--think-time", type=float, default=1.0, help="Mean seconds a user waits between commands")
+    parser.add_argument("--catalog", type=int, default=500, help="Number of manifests published on the fake Drive")
+    parser.add_argument("--distribution", choices=("zipf", "uniform"), default="zipf")
+    parser.add_argument("--zipf", type=float, default=1.1, help="Zipf exponent; higher means fewer, hotter IDs")
+    parser.add_argument("--sizes", default="256K:70,4M:25,24M:5", help="Manifest size mix as SIZE:WEIGHT,...")
+    parser.add_argument("--add-ratio", type=float, default=0.1, help="Share of commands that are /add_game")
+    parser.add_argument("--workers", type=int, default=QUEUE_WORKERS)
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE)
+    parser.add_argument("--production-limits", action="store_true",
+                        help="Keep the per-user and per-guild rate and concurrency limits")
+    parser.add_argument("--filesize-limit", type=parse_size, default=SPLIT_FILESIZE_LIMIT)
+    parser.add_argument("--drive-latency", type=float, default=0.05, help="Seconds added to every Drive request")
+    parser.add_argument("--bandwidth", type=float, default=50.0, help="Drive transfer rate in MiB/s per request")
+    parser.add_argument("--github-latency", type=float, default=0.05)
+    parser.add_argument("--discord-latency", type=float, default=0.05)
+    parser.add_argument("--drive-rps", type=float, default=REQUESTS_PER_SECOND,
+                        help="Drive scheduler budget (0 disables pacing)")
+    parser.add_argument("--file-workers", type=int, default=FILE_WORKERS,
+                        help="File worker processes for downloads and uploads (0 runs them in-process)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="Print the curve as JSON")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    scheduler.rate = args.drive_rps
+    sizes, weights = parse_mix(args.sizes)
+    rng = random.Random(args.seed)
+    catalogue = [(game_id, rng.choices(sizes, weights)[0]) for game_id in range(1, args.catalog + 1)]
+    env = Environment(args)
+    cwd = os.getcwd()
+    rows = []
+    try:
+        for concurrency in (int(level) for level in args.concurrency.split(",")):
+            rows.append(asyncio.run(run_level(env, concurrency, catalogue)))
+            if not args.json:
+                print(f"{concurrency} users: {rows[-1]['throughput_per_second']} ok/s", file=sys.stderr)
+    finally:
+        env.stop_file_workers()
+        os.chdir(cwd)
+        shutil.rmtree(env.workdir, ignore_errors=True)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    else:
+        print_curve(rows)
+
+
+if __name__ == "__main__":
+    main()
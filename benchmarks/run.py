@@ -0,0 +1,406 @@
+"""Offline benchmarks for the bot and CLI pipelines against in-process fakes.
+
+    python benchmarks/run.py                          # run everything and print a table
+    python benchmarks/run.py bot_get_manifest_cold    # run selected benchmarks
+    python benchmarks/run.py --save-baseline          # store results in benchmarks/baseline.json
+    python benchmarks/run.py --compare                # exit 1 if a result regressed past --tolerance
+
+Drive, GitHub and Discord are replaced by the stand-ins in fakes.py; everything else
+(admission, index, cache, buffers, splitting, zip building, uploads) is the real code.
+"""
+import argparse
+import asyncio
+import functools
+import inspect
+import itertools
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import redirect_stderr, redirect_stdout
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+from fakes import FakeDrive, FakeGitHub, FakeInteraction, FakeServicePool, SyntheticContent
+from admission import AdmissionController
+from drive_index import DriveFolderIndex
+from drive_scheduler import scheduler
+from file_worker import FILE_WORKERS, FileWorkerPool
+
+
+BASELINE_FILE = os.path.join(BENCHMARK_DIR, "baseline.json")
+GUILD_ID = 1
+REPOSITORY = "bench/manifests"
+CLI_FOLDER = "bench-folder"
+MEMORY_ITERATIONS = 3
+LARGE_FILE_SIZE = 24 * 1024 * 1024
+SPLIT_FILESIZE_LIMIT = 10 * 1024 * 1024
+GITHUB_FILES = {"1.manifest": 256 * 1024, "2.manifest": 64 * 1024, "Key.vdf": 1024}
+BATCH_SIZE = 8
+REQUEST_LOG_IDS = 50
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """Register ``setup(env)``, which prepares state and returns the operation to time."""
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+class Environment:
+    def __init__(self, args):
+        self.args = args
+        self.workdir = tempfile.mkdtemp(prefix="benchmarks-")
+        self._dirs = itertools.count(1)
+
+    def fresh_dir(self, prefix):
+        path = os.path.join(self.workdir, f"{prefix}-{next(self._dirs)}")
+        os.makedirs(path)
+        return path
+
+    @functools.cached_property
+    def bot(self):
+        # Bot keeps its cache, index and temp files relative to the working directory
+        os.chdir(self.workdir)
+        import Bot
+        logging.getLogger().setLevel(logging.WARNING)
+        return Bot
+
+    @functools.cached_property
+    def cli(self):
+        os.chdir(self.workdir)
+        import main
+        return main
+
+    def drive(self):
+        bandwidth = self.args.bandwidth * 1024 * 1024 if self.args.bandwidth else None
+        return FakeDrive(latency=self.args.drive_latency, bandwidth=bandwidth)
+
+    def interaction(self, user_id, filesize_limit=SPLIT_FILESIZE_LIMIT):
+        return FakeInteraction(user_id, GUILD_ID, filesize_limit, latency=self.args.discord_latency)
+
+    def wire_bot(self, drive, admission=None):
+        """Point the bot at ``drive`` with a fresh index, cache and admission queue."""
+        bot = self.bot
+        self.stop_file_workers()
+        bot.drive_pool = FakeServicePool(drive)
+        bot.manifest_index = DriveFolderIndex(bot.FOLDER_MANIFEST, os.path.join(self.fresh_dir("index"), "index.json"))
+        bot.manifest_cache = bot.ManifestCache(self.fresh_dir("cache"))
+        bot.inflight_downloads.clear()
+        bot.OFFICIAL_SERVER_IDS = {GUILD_ID}
+        bot.REPOSITORIES = [REPOSITORY]
+        bot.http_client = FakeGitHub(GITHUB_FILES, latency=self.args.github_latency).client()
+        # Limits are lifted so the pipeline, not admission, is what gets measured
+        bot.admission = admission or AdmissionController(
+            user_rate=1e9, user_burst=1e9, guild_rate=1e9, guild_burst=1e9,
+            guild_concurrency=10 ** 9, queue_size=10 ** 6,
+        )
+        return bot
+
+    def start_file_workers(self, bot, drive):
+        """Run the bot's file jobs in --file-workers processes, each with a copy of ``drive``.
+
+        Call it once ``drive`` holds every file the benchmark reads: the copies are taken
+        when the workers start, and what they upload stays in the workers.
+        """
+        self.stop_file_workers()
+        if not self.args.file_workers:
+            return
+        # Same split as Bot.start_file_workers: the workers get half of the Drive budget
+        worker_rate = scheduler.rate / 2
+        scheduler.rate -= worker_rate
+        bot.file_pool = FileWorkerPool(None, self.args.file_workers, worker_rate, service_factory=drive.service)
+
+    def stop_file_workers(self):
+        if "bot" in self.__dict__ and self.bot.file_pool is not None:
+            self.bot.file_pool.shutdown()
+            self.bot.file_pool = None
+        scheduler.rate = self.args.drive_rps
+
+    def wire_cli(self, drive):
+        cli = self.cli
+        cli.FOLDER_MANIFEST = CLI_FOLDER
+        cli.DRIVE_CREDENTIALS = None
+        cli.manifest_index = DriveFolderIndex(CLI_FOLDER, os.path.join(self.fresh_dir("index"), "index.json"))
+        cli.get_thread_service = lambda: drive
+        return cli
+
+
+async def run_command(bot, handler, interaction, game_id):
+    await handler.callback(interaction, game_id)
+    await bot.admission.queue.join()
+    if interaction.failed():
+        raise RuntimeError(f"{handler.name} {game_id} failed: {interaction.transcript()}")
+
+
+def quiet(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull), redirect_stderr(devnull):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def _get_manifest_benchmark(env, size, repeat_id, filesize_limit=SPLIT_FILESIZE_LIMIT):
+    drive = env.drive()
+    bot = env.wire_bot(drive)
+    count = env.args.iterations + MEMORY_ITERATIONS + 1
+    for game_id in range(1, 2 if repeat_id else count + 1):
+        # Generated on read, so file worker copies of the drive stay small
+        drive.add_file(f"{game_id}.zip", SyntheticContent(game_id, size), bot.FOLDER_MANIFEST)
+    env.start_file_workers(bot, drive)
+    ids = itertools.cycle([1]) if repeat_id else itertools.count(1)
+    users = itertools.count(1)
+
+    async def op():
+        interaction = env.interaction(next(users), filesize_limit)
+        await run_command(bot, bot.get_manifest, interaction, str(next(ids)))
+        if interaction.followup.attachment_bytes != size:
+            raise RuntimeError(f"Sent {interaction.followup.attachment_bytes} of {size} bytes")
+    return op
+
+
+@benchmark("bot_get_manifest_cold")
+def bench_get_manifest_cold(env):
+    return _get_manifest_benchmark(env, env.args.size, repeat_id=False)
+
+
+@benchmark("bot_get_manifest_cached")
+def bench_get_manifest_cached(env):
+    return _get_manifest_benchmark(env, env.args.size, repeat_id=True)
+
+
+@benchmark("bot_get_manifest_split")
+def bench_get_manifest_split(env):
+    return _get_manifest_benchmark(env, LARGE_FILE_SIZE, repeat_id=False)
+
+
+@benchmark("bot_add_game")
+def bench_add_game(env):
+    drive = env.drive()
+    bot = env.wire_bot(drive)
+    env.start_file_workers(bot, drive)
+    ids = itertools.count(1)
+
+    async def op():
+        game_id = next(ids)
+        await run_command(bot, bot.add_game, env.interaction(game_id), str(game_id))
+    return op
+
+
+@benchmark("bot_download_file")
+def bench_bot_download_file(env):
+    drive = env.drive()
+    bot = env.wire_bot(drive)
+    file = drive.add_file("1.zip", env.args.size)
+
+    async def op():
+        buffer = await bot.download_file(file["id"], file["name"])
+        if buffer is None:
+            raise RuntimeError("download_file failed")
+        buffer.close()
+    return op
+
+
+@benchmark("bot_split_file")
+def bench_split_file(env):
+    bot = env.bot
+    buffer = bot.DownloadBuffer()
+    buffer.write(os.urandom(LARGE_FILE_SIZE))
+
+    def op():
+        for _, part in bot.split_file(buffer, "1"):
+            while part.read(1024 * 1024):
+                pass
+            part.close()
+    return op
+
+
+@benchmark("cli_download_file")
+def bench_cli_download_file(env):
+    drive = env.drive()
+    cli = env.wire_cli(drive)
+    file = drive.add_file("1.zip", env.args.size, CLI_FOLDER)
+    download_dir = env.fresh_dir("downloads")
+
+    @quiet
+    def op():
+        path = cli.download_file(drive, file["id"], file["name"], download_dir, metadata=file)
+        if not path:
+            raise RuntimeError("download_file failed")
+        os.remove(path)
+    return op
+
+
+def _fetch_batch_benchmark(env, fresh):
+    drive = env.drive()
+    cli = env.wire_cli(drive)
+    game_ids = [str(game_id) for game_id in range(1, BATCH_SIZE + 1)]
+    for game_id in game_ids:
+        drive.add_file(f"{game_id}.zip", env.args.size, CLI_FOLDER)
+    download_dir = env.fresh_dir("downloads")
+
+    @quiet
+    def op():
+        summary = cli.fetch_batch(drive, game_ids, env.fresh_dir("downloads") if fresh else download_dir, workers=4)
+        if summary["failures"]:
+            raise RuntimeError(f"fetch_batch failed: {summary['failures']}")
+    return op
+
+
+@benchmark("cli_fetch_batch")
+def bench_fetch_batch(env):
+    return _fetch_batch_benchmark(env, fresh=True)
+
+
+@benchmark("cli_fetch_batch_unchanged")
+def bench_fetch_batch_unchanged(env):
+    return _fetch_batch_benchmark(env, fresh=False)
+
+
+@benchmark("cli_request_log")
+def bench_request_log(env):
+    from request_log import SubmissionQueue, compact_requests
+    drive = env.drive()
+    target = drive.add_file("requests.txt", b"", CLI_FOLDER)
+
+    def op():
+        queue = SubmissionQueue(drive, CLI_FOLDER, "add")
+        for game_id in range(REQUEST_LOG_IDS):
+            queue.submit(str(game_id))
+        queue.flush()
+        compact_requests(drive, CLI_FOLDER, target["id"])
+    return op
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def _call(op):
+    result = op()
+    if inspect.isawaitable(result):
+        await result
+
+
+async def measure(env, name):
+    op = BENCHMARKS[name](env)
+    await _call(op)  # warm-up: imports, index sync, first-touch allocations
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(env.args.iterations):
+        op_started = time.perf_counter()
+        await _call(op)
+        latencies.append(time.perf_counter() - op_started)
+    elapsed = time.perf_counter() - started
+    # Memory is measured in a separate pass because tracemalloc slows everything down
+    tracemalloc.start()
+    try:
+        for _ in range(MEMORY_ITERATIONS):
+            await _call(op)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        "iterations": env.args.iterations,
+        "ops_per_second": round(env.args.iterations / elapsed, 3),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "peak_memory_kb": round(peak / 1024),
+    }
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        checks = (
+            ("ops_per_second", current["ops_per_second"] < base["ops_per_second"] * (1 - tolerance)),
+            ("p99_ms", current["p99_ms"] > base["p99_ms"] * (1 + tolerance)),
+            ("peak_memory_kb", current["peak_memory_kb"] > base["peak_memory_kb"] * (1 + tolerance)),
+        )
+        for metric, regressed in checks:
+            if regressed:
+                regressions.append(f"{name}: {metric} {base[metric]} -> {current[metric]}")
+    return regressions
+
+
+def print_table(results, baseline):
+    print(f"{'benchmark':<28} {'ops/s':>10} {'p50 ms':>10} {'p99 ms':>10} {'peak KiB':>10}  vs baseline")
+    for name, result in results.items():
+        base = baseline.get(name)
+        delta = f"{(result['ops_per_second'] / base['ops_per_second'] - 1) * 100:+.1f}% ops/s" if base else ""
+        print(f"{name:<28} {result['ops_per_second']:>10.2f} {result['p50_ms']:>10.2f} "
+              f"{result['p99_ms']:>10.2f} {result['peak_memory_kb']:>10}  {delta}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline benchmarks with fake Drive, GitHub and Discord")
+    parser.add_argument("names", nargs="*", help=f"Benchmarks to run (default: all of {', '.join(BENCHMARKS)})")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--size", type=int, default=4 * 1024 * 1024, help="Manifest size in bytes")
+    parser.add_argument("--drive-latency", type=float, default=0.005, help="Seconds added to every Drive request")
+    parser.add_argument("--bandwidth", type=float, default=None, help="Drive transfer rate in MiB/s (default unlimited)")
+    parser.add_argument("--github-latency", type=float, default=0.005)
+    parser.add_argument("--discord-latency", type=float, default=0.005)
+    parser.add_argument("--drive-rps", type=float, default=0, help="Drive scheduler budget (default 0: unpaced)")
+    parser.add_argument("--file-workers", type=int, default=FILE_WORKERS,
+                        help="File worker processes for bot downloads and uploads (0 runs them in-process)")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true", help="Fail if results regressed against the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative regression")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON instead of a table")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    unknown = set(args.names) - set(BENCHMARKS)
+    if unknown:
+        sys.exit(f"Unknown benchmarks: {', '.join(sorted(unknown))}")
+    scheduler.rate = args.drive_rps
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+    env = Environment(args)
+    cwd = os.getcwd()
+    results = {}
+    try:
+        for name in args.names or BENCHMARKS:
+            results[name] = asyncio.run(measure(env, name))
+    finally:
+        env.stop_file_workers()
+        os.chdir(cwd)
+        shutil.rmtree(env.workdir, ignore_errors=True)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_table(results, baseline)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(dict(baseline, **results), f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+    if args.compare:
+        if not baseline:
+            sys.exit(f"No baseline at {args.baseline}; run with --save-baseline first.")
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
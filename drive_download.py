@@ -0,0 +1,202 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from google.auth.transport.requests import Request
+from drive_scheduler import scheduler
+from secure_stream import HEADER, TAG_SIZE, FrameCipher
+
+
+DRIVE_MEDIA_URL = "https://www.googleapis.com/drive/v3/files/{file_id}?alt=media"
+SEGMENT_SIZE = 8 * 1024 * 1024
+DOWNLOAD_WORKERS = 4
+# Below this size a single sequential stream is as fast as splitting it up
+MIN_RANGED_SIZE = 2 * SEGMENT_SIZE
+
+
+class ChecksumMismatch(Exception):
+    pass
+
+
+class RangedDownload:
+    """Downloads one Drive file as concurrent HTTP Range segments written in place.
+
+    Progress is recorded in a ``<path>.state.json`` sidecar so an interrupted download
+    picks up at the segments it had not finished. The md5 is computed in segment order
+    as data arrives, holding at most ``workers * 2`` segments in memory.
+    """
+
+    def __init__(self, credentials, file_id, size, md5_checksum, path,
+                 segment_size=SEGMENT_SIZE, workers=DOWNLOAD_WORKERS, progress=None, encryption_key=None):
+        self.credentials = credentials
+        self.file_id = file_id
+        self.size = int(size)
+        self.md5_checksum = md5_checksum
+        self.path = path
+        self.part_path = f"{path}.part"
+        self.state_path = f"{path}.state.json"
+        self.segment_size = segment_size
+        self.workers = workers
+        self.progress = progress
+        self.encryption_key = encryption_key
+        self._cipher = None
+        self.segment_count = max(1, -(-self.size // segment_size))
+        self._done = set()
+        self._file = None
+        self._file_lock = threading.Lock()
+        self._token_lock = threading.Lock()
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self._session.mount("https://", adapter)
+
+    def _state(self):
+        return {
+            "file_id": self.file_id,
+            "size": self.size,
+            "md5Checksum": self.md5_checksum,
+            "segment_size": self.segment_size,
+            "encrypted": self.encryption_key is not None,
+        }
+
+    def _load_state(self):
+        if not (os.path.exists(self.state_path) and os.path.exists(self.part_path)):
+            return set()
+        try:
+            with open(self.state_path, "r") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return set()
+        if {key: state.get(key) for key in self._state()} != self._state():
+            return set()
+        return set(state.get("done", []))
+
+    def _save_state(self):
+        state = self._state()
+        state["done"] = sorted(self._done)
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def _token(self):
+        with self._token_lock:
+            if not self.credentials.valid:
+                self.credentials.refresh(Request())
+            return self.credentials.token
+
+    def _bounds(self, index):
+        start = index * self.segment_size
+        return start, min(self.size, start + self.segment_size)
+
+    def _get_segment(self, url, start, end):
+        headers = {"Authorization": f"Bearer {self._token()}", "Range": f"bytes={start}-{end - 1}"}
+        response = self._session.get(url, headers=headers, timeout=60)
+        response.raise_for_status()
+        if len(response.content) != end - start:
+            raise ConnectionError(f"expected {end - start} bytes, got {len(response.content)}")
+        return response.content
+
+    def _fetch_segment(self, index):
+        start, end = self._bounds(index)
+        url = DRIVE_MEDIA_URL.format(file_id=self.file_id)
+        data = scheduler.call(self._get_segment, url, start, end)
+        stored = self._seal_segment(index, data) if self._cipher else data
+        with self._file_lock:
+            self._file.seek(self._storage_offset(index))
+            self._file.write(stored)
+        return data
+
+    def _read_segment(self, index):
+        start, end = self._bounds(index)
+        length = end - start
+        if self._cipher:
+            length += self._chunks_in(index) * TAG_SIZE
+        with self._file_lock:
+            self._file.seek(self._storage_offset(index))
+            stored = self._file.read(length)
+        return self._open_segment(index, stored) if self._cipher else stored
+
+    # With encryption at rest every segment is a whole number of cipher chunks,
+    # so segments can be sealed independently and written straight to their frames.
+    def _chunks_in(self, index):
+        start, end = self._bounds(index)
+        return -(-(end - start) // self._cipher.chunk_size)
+
+    def _storage_offset(self, index):
+        start, _ = self._bounds(index)
+        if self._cipher is None:
+            return start
+        return self._cipher.frame_offset(start // self._cipher.chunk_size)
+
+    def _seal_segment(self, index, data):
+        chunk_size = self._cipher.chunk_size
+        first = self._bounds(index)[0] // chunk_size
+        last = self._cipher.chunk_count(self.size) - 1
+        return b"".join(
+            self._cipher.seal(first + i, data[i * chunk_size:(i + 1) * chunk_size], first + i == last)
+            for i in range(self._chunks_in(index))
+        )
+
+    def _open_segment(self, index, stored):
+        frame_size = self._cipher.chunk_size + TAG_SIZE
+        first = self._bounds(index)[0] // self._cipher.chunk_size
+        last = self._cipher.chunk_count(self.size) - 1
+        return b"".join(
+            self._cipher.open(first + i, stored[i * frame_size:(i + 1) * frame_size], first + i == last)
+            for i in range(self._chunks_in(index))
+        )
+
+    def run(self):
+        self._done = self._load_state()
+        if self._done:
+            logging.info(f"Resuming {self.path}: {len(self._done)}/{self.segment_count} segments already present.")
+            self._file = open(self.part_path, "r+b")
+            if self.encryption_key:
+                self._cipher = FrameCipher.from_header(self.encryption_key, self._file.read(HEADER.size))
+        else:
+            self._file = open(self.part_path, "w+b")
+            if self.encryption_key:
+                self._cipher = FrameCipher(self.encryption_key)
+                if self.segment_size % self._cipher.chunk_size:
+                    raise ValueError("Segment size must be a multiple of the cipher chunk size.")
+                self._file.truncate(self._cipher.encrypted_size(self.size))
+                self._file.write(self._cipher.header)
+            else:
+                self._file.truncate(self.size)
+        md5 = hashlib.md5()
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                window = deque()
+                for index in range(self.segment_count):
+                    if index not in self._done:
+                        window.append((index, executor.submit(self._fetch_segment, index)))
+                    else:
+                        window.append((index, None))
+                    if len(window) < self.workers * 2:
+                        continue
+                    self._finish_segment(md5, *window.popleft())
+                while window:
+                    self._finish_segment(md5, *window.popleft())
+        finally:
+            self._file.close()
+        if self.md5_checksum and md5.hexdigest() != self.md5_checksum:
+            os.remove(self.part_path)
+            os.remove(self.state_path)
+            raise ChecksumMismatch(f"md5 {md5.hexdigest()} does not match Drive checksum {self.md5_checksum}")
+        os.replace(self.part_path, self.path)
+        os.remove(self.state_path)
+        return self.path
+
+    def _finish_segment(self, md5, index, future):
+        data = self._read_segment(index) if future is None else future.result()
+        md5.update(data)
+        if index not in self._done:
+            self._done.add(index)
+            self._save_state()
+        if self.progress:
+            self.progress(len(self._done) / self.segment_count)
@@ -0,0 +1,180 @@
+import json
+import logging
+import os
+import threading
+import time
+
+
+INDEX_FIELDS = "id, name, size, md5Checksum, modifiedTime"
+LIST_PAGE_SIZE = 1000
+# Names per combined "name = 'a' or name = 'b'" query, well under Drive's query length limit
+BATCH_QUERY_SIZE = 50
+
+
+def iter_folder_files(service, folder_id, fields=INDEX_FIELDS, page_size=LIST_PAGE_SIZE, query=None, order_by=None):
+    q = f"'{folder_id}' in parents and trashed = false"
+    if query:
+        q = f"{q} and ({query})"
+    page_token = None
+    while True:
+        results = service.files().list(
+            q=q,
+            fields=f"nextPageToken, files({fields})",
+            pageSize=page_size,
+            pageToken=page_token,
+            orderBy=order_by,
+        ).execute()
+        yield from results.get("files", [])
+        page_token = results.get("nextPageToken")
+        if not page_token:
+            break
+
+
+def _quote(value):
+    return value.replace("\\", "\\\\").replace("'", "\\'")
+
+
+def batch_lookup(service, folder_id, names, fields=INDEX_FIELDS, chunk_size=BATCH_QUERY_SIZE):
+    names = list(dict.fromkeys(names))
+    found = {}
+    for start in range(0, len(names), chunk_size):
+        query = " or ".join(f"name = '{_quote(name)}'" for name in names[start:start + chunk_size])
+        for file in iter_folder_files(service, folder_id, fields=fields, query=query):
+            found.setdefault(file["name"], file)
+    return found
+
+
+class DriveFolderIndex:
+    """Local name -> metadata index of one Drive folder, kept fresh from the changes feed.
+
+    The index and its changes page token are persisted to ``path`` so a restart only
+    replays the changes made while the process was down.
+    """
+
+    def __init__(self, folder_id, path):
+        self.folder_id = folder_id
+        self.path = path
+        self.entries = {}
+        self.page_token = None
+        self.synced_at = None
+        self._names_by_id = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    @property
+    def ready(self):
+        return self.page_token is not None
+
+    def is_fresh(self, max_age):
+        return self.ready and self.synced_at is not None and time.monotonic() - self.synced_at < max_age
+
+    def lookup(self, name):
+        return self.entries.get(name)
+
+    def find(self, service, name, max_age):
+        if not self.is_fresh(max_age):
+            self.sync(service)
+        return self.lookup(name)
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable index file {self.path}: {e}")
+            return
+        if data.get("folder_id") != self.folder_id:
+            return
+        with self._lock:
+            self.entries = data.get("entries", {})
+            self.page_token = data.get("page_token")
+            self._names_by_id = {entry["id"]: name for name, entry in self.entries.items()}
+
+    def save(self):
+        with self._lock:
+            data = {"folder_id": self.folder_id, "page_token": self.page_token, "entries": self.entries}
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+
+    def full_sync(self, service):
+        # Take the start token first so changes made during the listing are replayed afterwards
+        token = service.changes().getStartPageToken().execute()["startPageToken"]
+        entries = {}
+        for file in iter_folder_files(service, self.folder_id):
+            entries.setdefault(file["name"], file)
+        with self._lock:
+            self.entries = entries
+            self._names_by_id = {entry["id"]: name for name, entry in entries.items()}
+            self.page_token = token
+            self.synced_at = time.monotonic()
+        self.save()
+        logging.info(f"Indexed {len(entries)} files in folder {self.folder_id}.")
+
+    def sync(self, service):
+        if not self.ready:
+            return self.full_sync(service)
+        token = self.page_token
+        changed = 0
+        while True:
+            results = service.changes().list(
+                pageToken=token,
+                pageSize=LIST_PAGE_SIZE,
+                spaces="drive",
+                includeRemoved=True,
+                fields=f"nextPageToken, newStartPageToken, changes(fileId, removed, file(parents, trashed, {INDEX_FIELDS}))",
+            ).execute()
+            for change in results.get("changes", []):
+                changed += self._apply(change)
+            if "newStartPageToken" in results:
+                token = results["newStartPageToken"]
+                break
+            token = results["nextPageToken"]
+        with self._lock:
+            token_moved = token != self.page_token
+            self.page_token = token
+            self.synced_at = time.monotonic()
+        if changed or token_moved:
+            self.save()
+        return changed
+
+    def add(self, file):
+        with self._lock:
+            self._put(file)
+
+    def _apply(self, change):
+        file = change.get("file") or {}
+        in_folder = (
+            not change.get("removed")
+            and not file.get("trashed")
+            and self.folder_id in file.get("parents", [])
+        )
+        with self._lock:
+            removed = self._remove(change.get("fileId"))
+            if in_folder:
+                self._put({key: value for key, value in file.items() if key not in ("parents", "trashed")})
+        return int(removed or in_folder)
+
+    def _put(self, file):
+        self._remove(file["id"])
+        previous = self.entries.get(file["name"])
+        if previous is not None:
+            self._names_by_id.pop(previous["id"], None)
+        self.entries[file["name"]] = file
+        self._names_by_id[file["id"]] = file["name"]
+
+    def _remove(self, file_id):
+        name = self._names_by_id.pop(file_id, None)
+        if name is None:
+            return False
+        self.entries.pop(name, None)
+        return True
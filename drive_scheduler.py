@@ -0,0 +1,209 @@
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+import httplib2
+import requests
+from googleapiclient.http import HttpRequest
+from tracing import span
+
+
+# Drive's default per-user quota works out to about 10 requests per second
+REQUESTS_PER_SECOND = 10.0
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 32.0
+# Consecutive failed attempts that open the circuit, and how long it stays open
+BREAKER_THRESHOLD = 5
+BREAKER_COOLDOWN = 30.0
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded"}
+
+# Waiting interactive callers always get the next token before background ones
+INTERACTIVE = 0
+BACKGROUND = 1
+
+
+class CircuitOpen(Exception):
+    pass
+
+
+def _status(error):
+    resp = getattr(error, "resp", None)
+    if resp is not None:
+        return resp.status
+    return getattr(getattr(error, "response", None), "status_code", None)
+
+
+def _reasons(error):
+    details = getattr(error, "error_details", None)
+    response = getattr(error, "response", None)
+    if not details and response is not None:
+        try:
+            details = response.json()["error"]["errors"]
+        except (ValueError, KeyError, TypeError):
+            details = None
+    if not isinstance(details, list):
+        return set()
+    return {detail.get("reason") for detail in details if isinstance(detail, dict)}
+
+
+def _retry_after(error):
+    headers = getattr(error, "resp", None) or getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after") or headers.get("Retry-After") or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def is_retryable(error):
+    if isinstance(error, (ConnectionError, TimeoutError, httplib2.HttpLib2Error,
+                          requests.ConnectionError, requests.Timeout,
+                          requests.exceptions.ChunkedEncodingError)):
+        return True
+    status = _status(error)
+    if status in RETRYABLE_STATUSES:
+        return True
+    return status == 403 and bool(_reasons(error) & RATE_LIMIT_REASONS)
+
+
+class DriveScheduler:
+    """Paces, retries and circuit-breaks every Drive request made by this process.
+
+    Each attempt takes a token from a shared requests-per-second bucket. Rate-limit,
+    429 and 5xx responses and dropped connections are retried with full-jitter
+    exponential backoff. After BREAKER_THRESHOLD failed attempts in a row the circuit
+    opens and calls raise CircuitOpen straight away until one probe request succeeds.
+    """
+
+    def __init__(self, rate=REQUESTS_PER_SECOND, max_retries=MAX_RETRIES,
+                 breaker_threshold=BREAKER_THRESHOLD, breaker_cooldown=BREAKER_COOLDOWN):
+        self.rate = rate
+        self.max_retries = max_retries
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.retries = 0
+        self.rejected = 0
+        self._tokens = 1.0
+        self._updated = time.monotonic()
+        self._waiting = [0, 0]
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._cond = threading.Condition()
+        self._local = threading.local()
+
+    @property
+    def is_open(self):
+        return self.open_for > 0
+
+    @property
+    def open_for(self):
+        """Seconds until an open circuit lets a probe through; 0 when closed."""
+        if self._opened_at is None:
+            return 0.0
+        return max(0.0, self._opened_at + self.breaker_cooldown - time.monotonic())
+
+    @contextmanager
+    def priority(self, level):
+        previous = getattr(self._local, "priority", INTERACTIVE)
+        self._local.priority = level
+        try:
+            yield
+        finally:
+            self._local.priority = previous
+
+    def _check_circuit(self):
+        if self._opened_at is None:
+            return
+        if self.is_open or self._probing:
+            self.rejected += 1
+            raise CircuitOpen("Google Drive is unavailable; not sending more requests for now.")
+        # Cooldown is over: let this one request through to probe whether Drive is back
+        self._probing = True
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(max(1.0, self.rate), self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _acquire(self, priority):
+        with self._cond:
+            self._check_circuit()
+            if not self.rate:
+                return
+            self._waiting[priority] += 1
+            try:
+                while True:
+                    self._refill()
+                    yielding = priority == BACKGROUND and self._waiting[INTERACTIVE]
+                    if self._tokens >= 1 and not yielding:
+                        self._tokens -= 1
+                        return
+                    self._cond.wait(max(1 - self._tokens, 0) / self.rate or 1 / self.rate)
+            finally:
+                self._waiting[priority] -= 1
+                self._cond.notify_all()
+
+    def _record(self, failed):
+        with self._cond:
+            self._probing = False
+            if not failed:
+                self._failures = 0
+                self._opened_at = None
+                return
+            self._failures += 1
+            if self._failures >= self.breaker_threshold:
+                if self._opened_at is None:
+                    logging.error(f"Opening the Drive circuit after {self._failures} failed requests.")
+                self._opened_at = time.monotonic()
+
+    def call(self, func, *args, priority=None, **kwargs):
+        # Requests made inside an already scheduled call are covered by its token and retries
+        if getattr(self._local, "active", False):
+            return func(*args, **kwargs)
+        if priority is None:
+            priority = getattr(self._local, "priority", INTERACTIVE)
+        self._local.active = True
+        try:
+            for attempt in range(self.max_retries + 1):
+                self._acquire(priority)
+                try:
+                    result = func(*args, **kwargs)
+                except Exception as e:
+                    retryable = is_retryable(e)
+                    self._record(retryable)
+                    if not retryable or attempt == self.max_retries:
+                        raise
+                    delay = max(random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)), _retry_after(e))
+                    self.retries += 1
+                    logging.warning(f"Drive request failed ({e}); retry {attempt + 1} in {delay:.1f}s.")
+                    time.sleep(delay)
+                else:
+                    self._record(False)
+                    return result
+        finally:
+            self._local.active = False
+
+    def stats(self):
+        return {"retries": self.retries, "rejected": self.rejected, "open": self.is_open, "open_for": self.open_for}
+
+
+scheduler = DriveScheduler()
+
+
+class ScheduledHttpRequest(HttpRequest):
+    """HttpRequest whose execute() and next_chunk() go through the shared scheduler.
+
+    Pass it as ``requestBuilder`` to ``build()``; the scheduler does all retrying, so
+    the client's own ``num_retries`` is ignored.
+    """
+
+    def execute(self, http=None, num_retries=0):
+        with span("drive", method=self.methodId):
+            return scheduler.call(super().execute, http=http)
+
+    def next_chunk(self, http=None, num_retries=0):
+        with span("drive", method=self.methodId, chunk=True):
+            return scheduler.call(super().next_chunk, http=http)
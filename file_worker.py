@@ -0,0 +1,327 @@
+import asyncio
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from google.oauth2.service_account import Credentials
+from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaFileUpload, MediaIoBaseDownload
+from drive_index import INDEX_FIELDS
+from drive_scheduler import INTERACTIVE, CircuitOpen, ScheduledHttpRequest, is_retryable, scheduler
+from tracing import adopt_spans, capture, current_trace, span
+
+
+FILE_WORKERS = min(4, os.cpu_count() or 1)
+DRIVE_SCOPES = ["https://www.googleapis.com/auth/drive"]
+
+# Resumable upload sessions survive restarts here, keyed by file name and content hash
+UPLOAD_SESSIONS_FILE = os.path.join("temp", "upload_sessions.json")
+UPLOAD_CHUNK_UNIT = 256 * 1024  # Drive requires chunk sizes in multiples of 256 KiB
+UPLOAD_CHUNK_INITIAL = 4 * UPLOAD_CHUNK_UNIT
+UPLOAD_CHUNK_MAX = 256 * UPLOAD_CHUNK_UNIT
+UPLOAD_CHUNK_TARGET_SECONDS = 2.0
+# Failed chunks are resent from what Drive already holds this many times before giving up
+UPLOAD_CHUNK_RETRIES = 3
+UPLOAD_RETRY_DELAY = 5.0
+# Fixed zip entry timestamps, so the same files always give the same bytes and upload key
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+
+class FileJobError(Exception):
+    """A job failed in a worker process; carries the original error's type and message.
+
+    ``worker`` is the failing worker's report (see FileWorkerPool), so its scheduler
+    state reaches the parent even when the job does not return.
+    """
+
+    def __init__(self, message, worker=None):
+        super().__init__(message, worker)
+        self.message = message
+        self.worker = worker
+
+    def __str__(self):
+        return self.message
+
+
+def create_zip_file(game_id, files):
+    os.makedirs("temp", exist_ok=True)
+    zip_path = os.path.join("temp", f"{game_id}.zip")
+    with zipfile.ZipFile(zip_path, "w") as zip_file:
+        for file_name, content in files:
+            zip_file.writestr(zipfile.ZipInfo(file_name, date_time=ZIP_DATE_TIME), content)
+    return zip_path
+
+
+def load_upload_sessions():
+    try:
+        with open(UPLOAD_SESSIONS_FILE, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_upload_session(key, resumable_uri):
+    sessions = load_upload_sessions()
+    if resumable_uri:
+        sessions[key] = resumable_uri
+    else:
+        sessions.pop(key, None)
+    os.makedirs(os.path.dirname(UPLOAD_SESSIONS_FILE), exist_ok=True)
+    # Several processes update this file, so readers must never see a half-written one
+    tmp_path = f"{UPLOAD_SESSIONS_FILE}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(sessions, f)
+    os.replace(tmp_path, UPLOAD_SESSIONS_FILE)
+
+
+def upload_key(file_path, file_name):
+    digest = hashlib.md5()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return f"{file_name}:{digest.hexdigest()}"
+
+
+class TunableMediaUpload(MediaFileUpload):
+    """MediaFileUpload whose chunk size can change between chunks.
+
+    The client asks chunksize() before building every chunk, so setting ``chunk_size``
+    takes effect on the next one.
+    """
+
+    def __init__(self, filename, chunksize=UPLOAD_CHUNK_INITIAL):
+        super().__init__(filename, chunksize=chunksize, resumable=True)
+        self.chunk_size = chunksize
+
+    def chunksize(self):
+        return self.chunk_size
+
+
+def create_upload_request(service, file_path, file_name, folder_id):
+    file_metadata = {"name": file_name, "parents": [folder_id]}
+    media = TunableMediaUpload(file_path)
+    # Ask for everything the manifest index keeps, so the new file can go straight into it
+    request = service.files().create(body=file_metadata, media_body=media, fields=INDEX_FIELDS)
+    return request, media
+
+
+def query_upload_progress(request, size):
+    """Ask Drive how much of ``request``'s session it holds; returns (bytes held, response or None).
+
+    The response is the finished upload's metadata when Drive already has every byte.
+    """
+    headers = {"Content-Range": f"bytes */{size}", "Content-Length": "0"}
+    with span("drive upload status"):
+        resp, content = scheduler.call(request.http.request, request.resumable_uri, "PUT", headers=headers)
+    if resp.status in (200, 201):
+        return size, json.loads(content)
+    if resp.status != 308:
+        raise HttpError(resp, content, uri=request.resumable_uri)
+    if "range" not in resp:
+        return 0, None
+    return int(resp["range"].split("-")[1]) + 1, None
+
+
+def tuned_chunk_size(sent_bytes, elapsed):
+    if sent_bytes <= 0 or elapsed <= 0:
+        return UPLOAD_CHUNK_INITIAL
+    target = sent_bytes / elapsed * UPLOAD_CHUNK_TARGET_SECONDS
+    units = max(1, int(target // UPLOAD_CHUNK_UNIT))
+    return min(UPLOAD_CHUNK_MAX, units * UPLOAD_CHUNK_UNIT)
+
+
+def _session_gone(error):
+    status = getattr(getattr(error, "resp", None), "status", None)
+    return status in (404, 410)
+
+
+def upload_file(service, file_path, file_name, folder_id):
+    """Upload ``file_path`` as ``file_name``, resuming a saved session; returns the new file's metadata."""
+    key = upload_key(file_path, file_name)
+    size = os.path.getsize(file_path)
+    request, media = create_upload_request(service, file_path, file_name, folder_id)
+    response = None
+    resumable_uri = load_upload_sessions().get(key)
+    if resumable_uri:
+        logging.info(f"Resuming interrupted upload of {file_name}.")
+        request.resumable_uri = resumable_uri
+        try:
+            request.resumable_progress, response = query_upload_progress(request, size)
+        except Exception as e:
+            if not _session_gone(e):
+                raise
+            # The saved session expired or finished elsewhere: start over
+            logging.warning(f"Saved upload session for {file_name} is no longer valid; restarting.")
+            save_upload_session(key, None)
+            request, media = create_upload_request(service, file_path, file_name, folder_id)
+    failures = 0
+    while response is None:
+        sent_before = request.resumable_progress
+        started = time.monotonic()
+        try:
+            status, response = request.next_chunk()
+        except CircuitOpen:
+            raise
+        except Exception as e:
+            if request.resumable_uri is None:
+                raise
+            if _session_gone(e):
+                logging.warning(f"Upload session for {file_name} was lost; restarting.")
+                save_upload_session(key, None)
+                request, media = create_upload_request(service, file_path, file_name, folder_id)
+                continue
+            failures += 1
+            if not is_retryable(e) or failures > UPLOAD_CHUNK_RETRIES:
+                raise
+            logging.warning(f"Upload chunk for {file_name} failed ({e}); resending from what Drive holds.")
+            time.sleep(UPLOAD_RETRY_DELAY * failures)
+            request.resumable_progress, response = query_upload_progress(request, size)
+            continue
+        failures = 0
+        if request.resumable_uri:
+            save_upload_session(key, request.resumable_uri)
+        if status:
+            media.chunk_size = tuned_chunk_size(request.resumable_progress - sent_before, time.monotonic() - started)
+            logging.info(f"Upload progress: {int(status.progress() * 100)}% (next chunk {media.chunk_size // 1024} KiB)")
+    save_upload_session(key, None)
+    return response
+
+
+def add_manifest(service, game_id, files, folder_id):
+    """Zip ``files`` and upload them as ``<game_id>.zip``; returns (file metadata, bytes uploaded)."""
+    zip_path = create_zip_file(game_id, files)
+    size = os.path.getsize(zip_path)
+    metadata = upload_file(service, zip_path, f"{game_id}.zip", folder_id)
+    os.remove(zip_path)
+    return metadata, size
+
+
+def download_to_path(service, file_id, path):
+    """Download a Drive file into ``path``; returns its size."""
+    request = service.files().get_media(fileId=file_id)
+    with open(path, "wb") as f:
+        downloader = MediaIoBaseDownload(f, request)
+        done = False
+        while not done:
+            with span("drive media chunk"):
+                _, done = scheduler.call(downloader.next_chunk)
+        return f.tell()
+
+
+_credentials = None
+_service_factory = None
+_service = None
+
+
+def _init_worker(service_account_info, rate, service_factory):
+    global _credentials, _service_factory
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    scheduler.rate = rate
+    _service_factory = service_factory
+    if service_account_info:
+        _credentials = Credentials.from_service_account_info(service_account_info, scopes=DRIVE_SCOPES)
+
+
+def _worker_report(trace=None):
+    report = dict(scheduler.stats(), pid=os.getpid())
+    if trace is not None:
+        report.update(started_at=trace.started_at, spans=trace.spans)
+    return report
+
+
+def _run_job(func, priority, traced, *args):
+    global _service
+    # One process, one thread: a single service object (and httplib2 connection) is safe here
+    if _service is None and _service_factory is not None:
+        _service = _service_factory()
+    elif _service is None:
+        _service = build("drive", "v3", credentials=_credentials, requestBuilder=ScheduledHttpRequest)
+    trace = None
+    try:
+        with scheduler.priority(priority):
+            if not traced:
+                return func(_service, *args), _worker_report()
+            # The parent's trace cannot cross the process boundary, so this job's Drive
+            # spans are collected here and sent back with the result
+            with capture(func.__name__) as trace:
+                result = func(_service, *args)
+            return result, _worker_report(trace)
+    except Exception as e:
+        # Client errors often cannot be unpickled in the parent, so only their text crosses over
+        raise FileJobError(f"{type(e).__name__}: {e}", _worker_report(trace)) from None
+
+
+class FileWorkerPool:
+    """Worker processes that run Drive transfers and zip building away from the gateway.
+
+    Jobs are ``func(service, *args)`` callables from this module, like those passed to
+    Bot.run_drive. Each worker builds its own Drive service and paces its requests with
+    its own scheduler, so ``drive_rps`` is split evenly between them. Every job reports
+    its worker's retry count and circuit state back, which ``retries`` and ``is_open``
+    sum up. A job started inside a sampled trace also returns its Drive call spans,
+    which are added to that trace under the span that awaited the job. A worker that dies breaks the executor; the pool replaces it and fails only
+    the jobs that were running. ``service_factory``, a picklable callable, replaces the
+    Drive service the workers build (the benchmarks pass a fake).
+    """
+
+    def __init__(self, service_account_info, workers=FILE_WORKERS, drive_rps=0, service_factory=None):
+        self.workers = workers
+        self.running = 0
+        self._initargs = (service_account_info, drive_rps / workers, service_factory)
+        self._reports = {}
+        self._executor = self._create_executor()
+
+    def _create_executor(self):
+        # Spawned, not forked: the bot process already runs threads that may hold locks
+        return ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker, initargs=self._initargs,
+        )
+
+    async def run(self, func, *args, priority=INTERACTIVE):
+        executor = self._executor
+        traced = current_trace() is not None
+        self.running += 1
+        try:
+            result, report = await asyncio.get_running_loop().run_in_executor(
+                executor, _run_job, func, priority, traced, *args
+            )
+        except FileJobError as e:
+            self._record(e.worker)
+            raise
+        except BrokenProcessPool:
+            if self._executor is executor:
+                logging.error("A file worker process died; starting a new pool.")
+                self._executor = self._create_executor()
+                executor.shutdown(wait=False)
+            raise
+        finally:
+            self.running -= 1
+        self._record(report)
+        return result
+
+    def _record(self, report):
+        if report:
+            spans = report.pop("spans", None)
+            if spans:
+                adopt_spans(spans, report.pop("started_at"), f"file-worker-{report['pid']}")
+            # Counters only grow within a process, so the latest report per worker is its total
+            self._reports[report["pid"]] = dict(report, received=time.monotonic())
+
+    @property
+    def retries(self):
+        return sum(report["retries"] for report in self._reports.values())
+
+    @property
+    def is_open(self):
+        now = time.monotonic()
+        return any(report["received"] + report["open_for"] > now for report in self._reports.values())
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -1,22 +1,21 @@
+import time
+STARTUP_STARTED = time.perf_counter()
+
 import os
-from dotenv import load_dotenv
-from google.oauth2.service_account import Credentials
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload, MediaIoBaseUpload
-import io
-from tkinter import filedialog, Tk
-import requests
-from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-from cryptography.hazmat.backends import default_backend
 import base64
-from urllib.parse import urlparse
-from Crypto.Cipher import AES
-from Crypto.Util.Padding import pad, unpad
-from Crypto.Random import get_random_bytes
-from cryptography.hazmat.primitives import padding
-import nacl.secret
-import nacl.utils
+import hashlib
 import json
+import argparse
+import atexit
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, redirect_stdout
+from dotenv import load_dotenv
+from drive_index import DriveFolderIndex, batch_lookup, iter_folder_files
+from request_log import SubmissionQueue, compact_requests, format_record
+
+STARTUP_TIMINGS = [("module imports", time.perf_counter() - STARTUP_STARTED)]
 
 load_dotenv("tk.env")
 
@@ -27,6 +26,73 @@ FOLDER_UPDATE_REQUESTS = None
 TEXT_FILE_ADD_GAMES = None
 TEXT_FILE_UPDATE_REQUESTS = None
 CONFIG_FILE = "config.txt"
+DRIVE_CREDENTIALS = None
+DOWNLOAD_MANIFEST = ".downloads.json"
+# When PAYLOAD_KEY (base64, 32 bytes) is set, downloads are encrypted at rest as they stream in
+ENCRYPTED_SUFFIX = ".enc"
+BATCH_WORKERS = 4
+INDEX_FILE = "manifest_index.json"
+INDEX_MAX_AGE = 5 * 60
+manifest_index = None
+add_requests = None
+update_requests = None
+# Fast-start mode keeps the fetched key in the OS keyring and only its ETag and digest here
+CACHE_DIR = ".cache"
+KEY_CACHE_FILE = os.path.join(CACHE_DIR, "key.json")
+# Older versions cached the decrypted service configuration in plaintext here
+LEGACY_SERVICE_CONFIG_CACHE_FILE = os.path.join(CACHE_DIR, "service.json")
+KEYRING_SERVICE = "manifest-downloader"
+KEYRING_USER = "payload-key"
+# Requests not yet written to Drive, kept locally so a crash before the next flush keeps them
+ADD_JOURNAL_FILE = os.path.join(CACHE_DIR, "pending_add_requests.jsonl")
+UPDATE_JOURNAL_FILE = os.path.join(CACHE_DIR, "pending_update_requests.jsonl")
+FAST_START = False
+
+@contextmanager
+def startup_stage(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STARTUP_TIMINGS.append((name, time.perf_counter() - started))
+
+def print_startup_profile():
+    print("\nStartup profile:")
+    for name, seconds in STARTUP_TIMINGS:
+        print(f"  {name:<32} {seconds * 1000:8.1f} ms")
+    print(f"  {'total':<32} {(time.perf_counter() - STARTUP_STARTED) * 1000:8.1f} ms")
+
+def read_protected_json(path):
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_protected_json(path, data):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    # makedirs leaves an existing directory's mode alone
+    os.chmod(directory, 0o700)
+    tmp_path = f"{path}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+def build_drive_service(service_account_info):
+    global DRIVE_CREDENTIALS
+    with startup_stage("import google api client"):
+        from google.oauth2.service_account import Credentials
+        from googleapiclient.discovery import build
+        from drive_scheduler import ScheduledHttpRequest
+    with startup_stage("build drive service"):
+        creds = Credentials.from_service_account_info(service_account_info, scopes=SCOPES)
+        service = build("drive", "v3", credentials=creds, requestBuilder=ScheduledHttpRequest)
+    DRIVE_CREDENTIALS = creds
+    return service
 
 def display_welcome_message():
     banner = """
@@ -52,8 +118,7 @@ def authenticate_with_google_drive():
             "client_x509_cert_url": os.getenv("CLIENT_X509_CERT_URL"),
             "universe_domain": os.getenv("UNIVERSE_DOMAIN"),
         }
-        creds = Credentials.from_service_account_info(SERVICE_ACCOUNT_INFO, scopes=SCOPES)
-        return build("drive", "v3", credentials=creds)
+        return build_drive_service(SERVICE_ACCOUNT_INFO)
     except Exception as e:
         print(f"Error authenticating with Google Drive API: {e}")
         return None
@@ -61,8 +126,7 @@ def authenticate_with_google_drive():
 def authenticate_with_credentials(credentials_json):
     try:
         credentials_dict = json.loads(credentials_json)
-        creds = Credentials.from_service_account_info(credentials_dict, scopes=SCOPES)
-        return build("drive", "v3", credentials=creds)
+        return build_drive_service(credentials_dict)
     except Exception as e:
         print(f"Error authenticating with Google Drive API: {e}")
         return None
@@ -70,7 +134,7 @@ def authenticate_with_credentials(credentials_json):
 def authenticate_with_parsed_credentials(credentials_dict):
     try:
         private_key = credentials_dict.get("PRIVATE_KEY").replace("\\n", "\n").strip('"')
-        creds = Credentials.from_service_account_info({
+        return build_drive_service({
             "type": credentials_dict.get("TYPE"),
             "project_id": credentials_dict.get("PROJECT_ID"),
             "private_key_id": credentials_dict.get("PRIVATE_KEY_ID"),
@@ -82,8 +146,7 @@ def authenticate_with_parsed_credentials(credentials_dict):
             "auth_provider_x509_cert_url": credentials_dict.get("AUTH_PROVIDER_X509_CERT_URL"),
             "client_x509_cert_url": credentials_dict.get("CLIENT_X509_CERT_URL"),
             "universe_domain": credentials_dict.get("UNIVERSE_DOMAIN"),
-        }, scopes=SCOPES)
-        return build("drive", "v3", credentials=creds)
+        })
     except Exception as e:
         print(f"Error authenticating with Google Drive API: {e}")
         return None
@@ -96,6 +159,7 @@ def load_or_prompt_download_directory():
         return prompt_download_directory()
 
 def prompt_download_directory():
+    from tkinter import filedialog, Tk
     root = Tk()
     root.withdraw()
     download_dir = filedialog.askdirectory(title="Select Download Directory")
@@ -108,56 +172,111 @@ def prompt_download_directory():
         print("No download directory selected. Using current working directory.")
         return os.getcwd()
 
-def list_files_in_folder(service, folder_id):
+def list_files_in_folder(service, folder_id, fields="id, name"):
     try:
-        results = service.files().list(
-            q=f"'{folder_id}' in parents",
-            fields="files(id, name)"
-        ).execute()
-        return results.get("files", [])
+        yield from iter_folder_files(service, folder_id, fields=fields)
     except Exception as e:
+        # A partial listing would look complete to the caller, so the error is passed on
         print(f"Error listing files in folder: {e}")
-        return None
+        raise
+
+def payload_key():
+    encoded = os.getenv("PAYLOAD_KEY")
+    return base64.b64decode(encoded) if encoded else None
 
-def download_file(service, file_id, file_name, download_dir):
+def download_file(service, file_id, file_name, download_dir, metadata=None):
     try:
-        request = service.files().get_media(fileId=file_id)
-        download_path = os.path.join(download_dir, file_name)
-        with open(download_path, "wb") as f:
-            downloader = MediaIoBaseDownload(f, request)
-            done = False
-            while not done:
-                status, done = downloader.next_chunk()
-                print(f"Downloading {file_name}: {int(status.progress() * 100)}%")
+        key = payload_key()
+        download_path = os.path.join(download_dir, file_name + (ENCRYPTED_SUFFIX if key else ""))
+        if metadata is None:
+            metadata = service.files().get(fileId=file_id, fields="size, md5Checksum").execute()
+        size = int(metadata.get("size", 0))
+        from drive_download import RangedDownload, MIN_RANGED_SIZE
+        if DRIVE_CREDENTIALS and size >= MIN_RANGED_SIZE:
+            RangedDownload(
+                DRIVE_CREDENTIALS, file_id, size, metadata.get("md5Checksum"), download_path,
+                progress=lambda fraction: print(f"Downloading {file_name}: {int(fraction * 100)}%"),
+                encryption_key=key,
+            ).run()
+        else:
+            from googleapiclient.http import MediaIoBaseDownload
+            from drive_scheduler import scheduler
+            request = service.files().get_media(fileId=file_id)
+            from secure_stream import EncryptingWriter
+            with open(download_path, "wb") as f:
+                sink = EncryptingWriter(f, key) if key else f
+                downloader = MediaIoBaseDownload(sink, request)
+                done = False
+                while not done:
+                    status, done = scheduler.call(downloader.next_chunk)
+                    print(f"Downloading {file_name}: {int(status.progress() * 100)}%")
+                if key:
+                    sink.close()
         print(f"Downloaded {file_name}.")
         return download_path
     except Exception as e:
         print(f"Error downloading file '{file_name}': {e}")
         return None
 
-def write_code_snippet(service, file_id, text_to_append):
+def load_download_manifest(download_dir):
+    path = os.path.join(download_dir, DOWNLOAD_MANIFEST)
+    if not os.path.exists(path):
+        return {}
     try:
-        if not file_id:
-            raise ValueError("Missing file ID for appending.")
-        file_content = service.files().get_media(fileId=file_id).execute()
-        existing_content = file_content.decode("utf-8")
-        updated_content = f"{existing_content}\n{text_to_append}"
-        media_body = MediaIoBaseUpload(io.BytesIO(updated_content.encode("utf-8")), mimetype="text/plain")
-        service.files().update(fileId=file_id, media_body=media_body).execute()
-        print("Your request has been submitted.")
-    except Exception as e:
-        print(f"Error appending to file: {e}")
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_download_manifest(download_dir, manifest):
+    path = os.path.join(download_dir, DOWNLOAD_MANIFEST)
+    with open(f"{path}.tmp", 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+def current_local_copy(manifest, download_dir, file_name, metadata):
+    entry = manifest.get(file_name)
+    if not entry or not all(entry.get(key) == metadata.get(key) for key in ("id", "md5Checksum", "modifiedTime")):
+        return None
+    download_path = os.path.join(download_dir, entry.get("local_name", file_name))
+    if os.path.exists(download_path) and os.path.getsize(download_path) == entry.get("local_size"):
+        return download_path
+    return None
 
-def download_code_snippet(service, folder_id):
+def manifest_entry(metadata, download_path):
+    return dict(metadata, local_name=os.path.basename(download_path), local_size=os.path.getsize(download_path))
+
+def download_if_changed(service, file_id, file_name, download_dir):
     try:
-        results = service.files().list(
-            q=f"'{folder_id}' in parents",
-            fields="files(id, name)"
-        ).execute()
-        return results.get("files", [])
+        metadata = service.files().get(fileId=file_id, fields="id, size, md5Checksum, modifiedTime").execute()
     except Exception as e:
-        print(f"Error listing files in folder: {e}")
+        print(f"Error fetching metadata for '{file_name}': {e}")
         return None
+    manifest = load_download_manifest(download_dir)
+    download_path = current_local_copy(manifest, download_dir, file_name, metadata)
+    if download_path:
+        print(f"{file_name} is already up to date.")
+        return download_path
+    download_path = download_file(service, file_id, file_name, download_dir, metadata=metadata)
+    if download_path:
+        manifest[file_name] = manifest_entry(metadata, download_path)
+        try:
+            save_download_manifest(download_dir, manifest)
+        except OSError as e:
+            print(f"Could not update the download manifest: {e}")
+    return download_path
+
+def write_code_snippet(queue, game_id):
+    try:
+        if not queue.folder_id:
+            raise ValueError("Missing folder ID for appending.")
+        queue.submit(game_id)
+        print("Your request has been saved and will be submitted shortly.")
+    except Exception as e:
+        print(f"Error appending to file: {e}")
+
+def download_code_snippet(service, folder_id):
+    return list_files_in_folder(service, folder_id)
 
 def fetch_api_data(service, folder_id, file_name):
     try:
@@ -174,22 +293,39 @@ def fetch_api_data(service, folder_id, file_name):
         print(f"Error retrieving file ID for {file_name}: {e}")
         return None
 
+def find_manifest(service, game_id):
+    try:
+        return manifest_index.find(service, f"{game_id}.zip", INDEX_MAX_AGE)
+    except Exception as e:
+        print(f"Error syncing manifest index, searching Drive directly: {e}")
+        query = f"'{FOLDER_MANIFEST}' in parents and name='{game_id}.zip'"
+        results = service.files().list(q=query, fields="files(id, name)").execute()
+        files = results.get("files", [])
+        return files[0] if files else None
+
+def resolve_manifests(service, game_ids):
+    names = {game_id: f"{game_id}.zip" for game_id in game_ids}
+    try:
+        if not manifest_index.is_fresh(INDEX_MAX_AGE):
+            manifest_index.sync(service)
+        found = {name: manifest_index.lookup(name) for name in names.values()}
+    except Exception as e:
+        print(f"Error syncing manifest index, searching Drive directly: {e}")
+        found = batch_lookup(service, FOLDER_MANIFEST, names.values())
+    return {game_id: found.get(name) for game_id, name in names.items()}
+
 def get_manifest(service, download_dir):
     try:
         game_id = input("Enter a game ID (integer value only): ").strip()
         while not game_id.isdigit():
             print("Invalid input. Please enter an integer value.")
             game_id = input("Enter a game ID (integer value only): ").strip()
-        folder_id = FOLDER_MANIFEST
-        query = f"'{folder_id}' in parents and name='{game_id}.zip'"
-        results = service.files().list(q=query, fields="files(id, name)").execute()
-        files = results.get("files", [])
-        if files:
-            file = files[0]
+        file = find_manifest(service, game_id)
+        if file:
             print(f"Game ID {game_id} found: {file['name']}")
             download_choice = input(f"Do you want to download {file['name']}? (y/n): ").strip().lower()
             if download_choice == "y":
-                download_path = download_file(service, file["id"], file["name"], download_dir)
+                download_path = download_if_changed(service, file["id"], file["name"], download_dir)
                 if download_path:
                     print(f"File {file['name']} downloaded successfully.")
                     print(f"File downloaded at: {download_path}")
@@ -208,15 +344,12 @@ def request_game(service, download_dir):
         while not game_id.isdigit():
             print("Invalid input. Please enter an integer value.")
             game_id = input("Enter a  ID (integer value only): ").strip()
-        query = f"'{FOLDER_MANIFEST}' in parents and name='{game_id}.zip'"
-        results = service.files().list(q=query, fields="files(id, name)").execute()
-        files = results.get("files", [])
-        if files:
-            game_file = files[0]
+        game_file = find_manifest(service, game_id)
+        if game_file:
             print(f"File {game_id}.zip already exists.")
             download_choice = input(f"Do you want to download {game_file['name']}? (y/n): ").strip().lower()
             if download_choice == "y":
-                download_path = download_file(service, game_file["id"], game_file["name"], download_dir)
+                download_path = download_if_changed(service, game_file["id"], game_file["name"], download_dir)
                 if download_path:
                     print(f"File {game_file['name']} downloaded successfully.")
                     print(f"File downloaded at: {download_path}")
@@ -225,7 +358,7 @@ def request_game(service, download_dir):
             else:
                 print("Download cancelled.")
         else:
-            write_code_snippet(service, TEXT_FILE_ADD_GAMES, f"Request for Game ID: {game_id}")
+            write_code_snippet(add_requests, game_id)
     except Exception as e:
         print(f"Error: {e}")
 
@@ -235,24 +368,31 @@ def request_update(service):
         while not game_id.isdigit():
             print("Invalid input. Please enter an integer value.")
             game_id = input("Enter a  ID (integer value only): ")
-        folder_id = FOLDER_MANIFEST
-        query = f"'{folder_id}' in parents and name='{game_id}.zip'"
-        results = service.files().list(q=query, fields="files(id, name)").execute()
-        files = results.get("files", [])
-        if files:
-            
-            write_code_snippet(service, TEXT_FILE_UPDATE_REQUESTS, f"Update request for ID: {game_id}")
+        if find_manifest(service, game_id):
+            write_code_snippet(update_requests, game_id)
         else:
             print("This File doesn't exist in our database yet. Please request using option 2. ")
     except Exception as e:
         print(f"Error: {e}")
 
+def flush_requests():
+    for queue in (add_requests, update_requests):
+        if queue is None:
+            continue
+        try:
+            queue.flush()
+        except Exception as e:
+            print(f"Error submitting queued requests: {e}")
+
 def exit_program():
+    flush_requests()
     print("Exiting the program.")
     import sys
     sys.exit()
 
 def verify_digital_signature():
+    import nacl.secret
+    import nacl.utils
     key = nacl.utils.random(nacl.secret.SecretBox.KEY_SIZE)
     return nacl.secret.SecretBox(key)
 
@@ -263,22 +403,77 @@ class SecureDataTransfer:
     def clear(self):
         self.data = None
 
-def fetch_http_request(repo_url, token):
+def load_keyring_key():
+    try:
+        import keyring
+        encoded = keyring.get_password(KEYRING_SERVICE, KEYRING_USER)
+    except Exception:
+        return None
+    return base64.b64decode(encoded) if encoded else None
+
+def store_keyring_key(key):
+    try:
+        import keyring
+        keyring.set_password(KEYRING_SERVICE, KEYRING_USER, base64.b64encode(key).decode("ascii"))
+    except Exception as e:
+        print(f"Could not store the key in the OS keyring ({e}); --fast-start will fetch it every time.")
+        return False
+    return True
+
+def purge_plaintext_cache():
+    if os.path.exists(LEGACY_SERVICE_CONFIG_CACHE_FILE):
+        os.remove(LEGACY_SERVICE_CONFIG_CACHE_FILE)
+    cached = read_protected_json(KEY_CACHE_FILE)
+    if cached and "key" in cached:
+        os.remove(KEY_CACHE_FILE)
+
+def cached_key():
+    cached = read_protected_json(KEY_CACHE_FILE)
+    if not cached or not cached.get("etag"):
+        return None, None
+    key = load_keyring_key()
+    # The keyring entry is shared with anything else running as this user, so check it
+    # is still the key this ETag was recorded for
+    if not key or hashlib.sha256(key).hexdigest() != cached.get("key_sha256"):
+        return None, None
+    return cached["etag"], key
+
+def fetch_http_request(repo_url, token, use_cache=False):
+    import requests
     owner_repo = repo_url.split("github.com/")[-1].replace('/tree/main', '')
-    api_url = 
+    api_url = f"https://api.github.com/repos/{owner_repo}/contents/Key.txt"
     headers = {"Authorization": f"token {token}"}
-    response = requests.get(api_url, headers=headers)
+    etag, key = cached_key() if use_cache else (None, None)
+    if key:
+        headers["If-None-Match"] = etag
+    try:
+        response = requests.get(api_url, headers=headers, timeout=10)
+    except requests.RequestException as e:
+        if key:
+            print(f"Could not reach GitHub ({e}); using the key from the OS keyring.")
+            return key
+        raise
+    if response.status_code == 304 and key:
+        return key
     if response.status_code == 200:
         content = response.json().get('content')
         if content:
             base64_content = base64.b64decode(content).decode('utf-8')
             key = base64.b64decode(base64_content)
             if len(key) == 32:  
+                if FAST_START and response.headers.get("ETag") and store_keyring_key(key):
+                    write_protected_json(KEY_CACHE_FILE, {
+                        "etag": response.headers["ETag"],
+                        "key_sha256": hashlib.sha256(key).hexdigest(),
+                    })
                 return key
     print("Key.txt not found or failed to fetch.")
     return None
 
 def decrypt_http_response(ciphertext, key, iv):
+    from cryptography.hazmat.primitives import padding
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+    from cryptography.hazmat.backends import default_backend
     cipher = Cipher(algorithms.AES(key), modes.CBC(iv), backend=default_backend())
     decryptor = cipher.decryptor()
     padded_plaintext = decryptor.update(ciphertext) + decryptor.finalize()
@@ -286,26 +481,45 @@ def decrypt_http_response(ciphertext, key, iv):
     plaintext = unpadder.update(padded_plaintext) + unpadder.finalize()
     return plaintext
 
-def verify_digital_copy(input_file, repo_url, token):
-    key = fetch_http_request(repo_url, token)
-    if not key:
-        return None
-
+def load_service_configuration(input_file, repo_url, token):
     with open(input_file, "rb") as f:
         encrypted_data = f.read()
+    purge_plaintext_cache()
 
-    iv = encrypted_data[:16]
-    ciphertext = encrypted_data[16:]
+    with startup_stage("fetch key"):
+        key = fetch_http_request(repo_url, token, use_cache=FAST_START)
+    if not key:
+        return None
 
-    plaintext = decrypt_http_response(ciphertext, key, iv)
+    with startup_stage("decrypt service config"):
+        iv = encrypted_data[:16]
+        ciphertext = encrypted_data[16:]
+
+        try:
+            plaintext = decrypt_http_response(ciphertext, key, iv)
+        except ValueError:
+            if not FAST_START:
+                raise
+            # The cached key no longer opens this file; it was rotated since it was cached
+            key = fetch_http_request(repo_url, token)
+            if not key:
+                return None
+            plaintext = decrypt_http_response(ciphertext, key, iv)
+
+        credentials_str = plaintext.decode('utf-8', errors='ignore')
+        credentials_lines = credentials_str.splitlines()
+        credentials_dict = {}
+        for line in credentials_lines:
+            if '=' in line:
+                key, value = line.split('=', 1)
+                credentials_dict[key.strip()] = value.strip().strip('"')
+
+    return credentials_dict
 
-    credentials_str = plaintext.decode('utf-8', errors='ignore')
-    credentials_lines = credentials_str.splitlines()
-    credentials_dict = {}
-    for line in credentials_lines:
-        if '=' in line:
-            key, value = line.split('=', 1)
-            credentials_dict[key.strip()] = value.strip().strip('"')
+def verify_digital_copy(input_file, repo_url, token):
+    credentials_dict = load_service_configuration(input_file, repo_url, token)
+    if not credentials_dict:
+        return None
 
     global FOLDER_MANIFEST, FOLDER_ADD_GAMES, FOLDER_UPDATE_REQUESTS
     FOLDER_MANIFEST = credentials_dict.get("FOLDER_MANIFEST")
@@ -314,36 +528,255 @@ def verify_digital_copy(input_file, repo_url, token):
 
     return authenticate_with_parsed_credentials(credentials_dict)
 
-def main():
-    display_welcome_message()
-    print("\nWelcome User")
-    print("Options:")
-    print("1- Get File")
-    print("2- Request File")
-    print("3- Request an File")
-    print("4- Exit")
-
+def compact_request_logs(service, interval=None):
+    from drive_scheduler import BACKGROUND, scheduler
+    with scheduler.priority(BACKGROUND):
+        _compact_request_logs(service, interval)
+
+def _compact_request_logs(service, interval):
+    while True:
+        for folder_id, file_id in (
+            (FOLDER_ADD_GAMES, TEXT_FILE_ADD_GAMES),
+            (FOLDER_UPDATE_REQUESTS, TEXT_FILE_UPDATE_REQUESTS),
+        ):
+            try:
+                summary = compact_requests(service, folder_id, file_id)
+                if summary:
+                    print(f"Request list {file_id} now holds {len(summary)} IDs, most requested first:")
+                for record in summary:
+                    print(f"  {format_record(record)}")
+            except Exception as e:
+                print(f"Error compacting requests in folder {folder_id}: {e}")
+        if not interval:
+            return
+        time.sleep(interval)
+
+_thread_services = threading.local()
+
+def build_thread_service():
+    from googleapiclient.discovery import build
+    from drive_scheduler import ScheduledHttpRequest
+    return build("drive", "v3", credentials=DRIVE_CREDENTIALS, requestBuilder=ScheduledHttpRequest)
+
+def get_thread_service():
+    # httplib2 is not thread-safe, so each batch worker builds its own client on the shared credentials
+    service = getattr(_thread_services, "service", None)
+    if service is None:
+        service = build_thread_service()
+        _thread_services.service = service
+    return service
+
+def fetch_one(game_id, file, download_dir, manifest, manifest_lock):
+    started = time.perf_counter()
+    result = {"id": game_id, "name": file["name"], "status": "failed", "bytes": 0}
+    try:
+        service = get_thread_service()
+        metadata = service.files().get(fileId=file["id"], fields="id, size, md5Checksum, modifiedTime").execute()
+        with manifest_lock:
+            current = current_local_copy(manifest, download_dir, file["name"], metadata)
+        if current:
+            result["status"] = "unchanged"
+        else:
+            download_path = download_file(service, file["id"], file["name"], download_dir, metadata=metadata)
+            if not download_path:
+                raise IOError("download failed")
+            with manifest_lock:
+                manifest[file["name"]] = manifest_entry(metadata, download_path)
+            result["status"] = "downloaded"
+            result["bytes"] = os.path.getsize(download_path)
+    except Exception as e:
+        result["error"] = str(e)
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    return result
+
+def read_batch_ids(ids, id_file):
+    ids = list(ids)
+    if id_file:
+        with open(id_file, 'r') as f:
+            ids.extend(f.read().split())
+    if "-" in ids or (not ids and not sys.stdin.isatty()):
+        ids = [game_id for game_id in ids if game_id != "-"] + sys.stdin.read().split()
+    return list(dict.fromkeys(game_id.strip() for game_id in ids if game_id.strip()))
+
+def fetch_batch(service, game_ids, download_dir, workers=BATCH_WORKERS):
+    started = time.perf_counter()
+    requested = len(game_ids)
+    failures = [{"id": game_id, "error": "invalid id"} for game_id in game_ids if not game_id.isdigit()]
+    game_ids = [game_id for game_id in game_ids if game_id.isdigit()]
+    try:
+        with redirect_stdout(sys.stderr):
+            resolved = resolve_manifests(service, game_ids)
+    except Exception as e:
+        failures.extend({"id": game_id, "error": f"lookup failed: {e}"} for game_id in game_ids)
+        resolved = {}
+    failures.extend({"id": game_id, "error": "not found"} for game_id, file in resolved.items() if not file)
+    manifest = load_download_manifest(download_dir)
+    manifest_lock = threading.Lock()
+    # Progress output goes to stderr so stdout carries only the JSON summary
+    with redirect_stdout(sys.stderr), ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(
+            lambda item: fetch_one(item[0], item[1], download_dir, manifest, manifest_lock),
+            [(game_id, file) for game_id, file in resolved.items() if file],
+        ))
+    try:
+        save_download_manifest(download_dir, manifest)
+    except OSError as e:
+        print(f"Could not update the download manifest: {e}", file=sys.stderr)
+    failures.extend({"id": result["id"], "error": result["error"]} for result in results if "error" in result)
+    elapsed = time.perf_counter() - started
+    total_bytes = sum(result["bytes"] for result in results)
+    return {
+        "requested": requested,
+        "downloaded": sum(1 for result in results if result["status"] == "downloaded"),
+        "unchanged": sum(1 for result in results if result["status"] == "unchanged"),
+        "total_bytes": total_bytes,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_bytes_per_second": round(total_bytes / elapsed) if elapsed else 0,
+        "files": results,
+        "failures": failures,
+    }
+
+def benchmark_crypto():
+    from secure_stream import benchmark_backends, fastest_backend, save_backend_choice
+    results = benchmark_backends()
+    for name, by_size in results.items():
+        print(f"\n{name}")
+        print(f"  {'payload':>10} {'seal MB/s':>12} {'open MB/s':>12} {'us/call':>10}")
+        for size, (seal_rate, open_rate, seconds) in by_size.items():
+            print(f"  {size:>10} {seal_rate:>12.1f} {open_rate:>12.1f} {seconds * 1e6:>10.1f}")
+    fastest = fastest_backend(results)
+    save_backend_choice(fastest)
+    print(f"\nFastest backend on this machine: {fastest} (saved as the 'auto' choice)")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Secure file manager")
+    parser.add_argument("--fast-start", action="store_true",
+                        help="Keep the fetched key in the OS keyring (needs the keyring package)")
+    parser.add_argument("--profile-startup", action="store_true", help="Print an import/bootstrap timing breakdown")
+    parser.add_argument("--drive-rps", type=float, default=None,
+                        help="Drive API requests per second shared by all workers (default 10, 0 disables pacing)")
+    subparsers = parser.add_subparsers(dest="command")
+    compact_parser = subparsers.add_parser("compact", help="Merge submitted requests into the request lists")
+    compact_parser.add_argument("--interval", type=int, default=None, help="Keep running, compacting every N seconds")
+    fetch_parser = subparsers.add_parser("fetch", help="Download many IDs without prompts and print a JSON summary")
+    fetch_parser.add_argument("ids", nargs="*", help="IDs to fetch; '-' reads more IDs from stdin")
+    fetch_parser.add_argument("--file", help="Read whitespace-separated IDs from this file")
+    fetch_parser.add_argument("--workers", type=int, default=BATCH_WORKERS, help="Concurrent downloads")
+    fetch_parser.add_argument("--output", help="Download directory (defaults to the one in config.txt)")
+    for name, action in (("encrypt", "Encrypt"), ("decrypt", "Decrypt")):
+        crypt_parser = subparsers.add_parser(name, help=f"{action} a payload with PAYLOAD_KEY in constant memory")
+        crypt_parser.add_argument("input")
+        crypt_parser.add_argument("output")
+        crypt_parser.add_argument("--crypto-workers", type=int, default=None,
+                                  help="Chunks processed in parallel (defaults to the number of cores)")
+        crypt_parser.add_argument("--crypto-backend", default="auto",
+                                  help="Cipher implementation (see bench-crypto); 'auto' uses the benchmarked fastest")
+    subparsers.add_parser("bench-crypto", help="Measure every crypto backend and remember the fastest")
+    return parser.parse_args()
+
+def connect():
     github_token = os.getenv("GITHUB_TOKEN")
     if not github_token:
         print("GitHub token not found. Please set it in the environment variables.")
-        return
+        return None
 
     repo_url = "Your Token Here"
 
     encrypted_file = "FetchInfo.env.enc"
     if not os.path.exists(encrypted_file):
         print(f"File '{encrypted_file}' not found.")
-        return
+        return None
 
     service = verify_digital_copy(encrypted_file, repo_url, github_token)
+    if not service:
+        print("Failed to authenticate with Google Drive API.")
+        return None
 
-    if service:
-        download_dir = load_or_prompt_download_directory()
-
-        global TEXT_FILE_ADD_GAMES, TEXT_FILE_UPDATE_REQUESTS
+    global TEXT_FILE_ADD_GAMES, TEXT_FILE_UPDATE_REQUESTS, manifest_index, add_requests, update_requests
+    manifest_index = DriveFolderIndex(FOLDER_MANIFEST, INDEX_FILE)
+    # Each queue flushes from its own timer thread, so each gets its own client
+    add_requests = SubmissionQueue(
+        build_thread_service(), FOLDER_ADD_GAMES, "Request for Game ID", journal_path=ADD_JOURNAL_FILE
+    )
+    update_requests = SubmissionQueue(
+        build_thread_service(), FOLDER_UPDATE_REQUESTS, "Update request for ID",
+        journal_path=UPDATE_JOURNAL_FILE,
+    )
+    add_requests.start()
+    update_requests.start()
+    with startup_stage("resolve request lists"):
         TEXT_FILE_ADD_GAMES = fetch_api_data(service, FOLDER_ADD_GAMES, "For Addition.txt")
         TEXT_FILE_UPDATE_REQUESTS = fetch_api_data(service, FOLDER_UPDATE_REQUESTS, "For Updating.txt")
+    return service
+
+def main():
+    global FAST_START
+    args = parse_args()
+    FAST_START = args.fast_start
+    if args.drive_rps is not None:
+        from drive_scheduler import scheduler
+        scheduler.rate = args.drive_rps
+    if args.command == "compact":
+        service = connect()
+        if args.profile_startup:
+            print_startup_profile()
+        if service:
+            compact_request_logs(service, args.interval)
+        return
+    if args.command == "bench-crypto":
+        benchmark_crypto()
+        return
+    if args.command in ("encrypt", "decrypt"):
+        key = payload_key()
+        if not key:
+            print("PAYLOAD_KEY not found. Please set it in the environment variables.")
+            sys.exit(1)
+        from secure_stream import CRYPTO_WORKERS, encrypt_file, decrypt_file
+        workers = max(1, args.crypto_workers or CRYPTO_WORKERS)
+        try:
+            if args.command == "encrypt":
+                encrypt_file(args.input, args.output, key, workers=workers, backend=args.crypto_backend)
+            else:
+                decrypt_file(args.input, args.output, key, workers=workers, backend=args.crypto_backend)
+        except (ValueError, RuntimeError) as e:
+            print(f"Could not {args.command} {args.input}: {e}")
+            sys.exit(1)
+        print(f"{args.command.capitalize()}ed {args.input} -> {args.output}")
+        return
+    if args.command == "fetch":
+        game_ids = read_batch_ids(args.ids, args.file)
+        with redirect_stdout(sys.stderr):
+            service = connect()
+            if args.profile_startup:
+                print_startup_profile()
+        if not service:
+            sys.exit(1)
+        download_dir = args.output
+        if not download_dir and os.path.exists(CONFIG_FILE):
+            download_dir = load_or_prompt_download_directory()
+        if not download_dir:
+            print("No download directory: pass --output or pick one from the menu first.", file=sys.stderr)
+            sys.exit(2)
+        summary = fetch_batch(service, game_ids, download_dir, max(1, args.workers))
+        print(json.dumps(summary, indent=2))
+        sys.exit(1 if summary["failures"] else 0)
 
+    display_welcome_message()
+    print("\nWelcome User")
+    print("Options:")
+    print("1- Get File")
+    print("2- Request File")
+    print("3- Request an File")
+    print("4- Exit")
+
+    service = connect()
+    if args.profile_startup:
+        print_startup_profile()
+
+    if service:
+        download_dir = load_or_prompt_download_directory()
+
+        atexit.register(flush_requests)
         while True:
             choice = input("\nEnter your selection: ")
 
@@ -358,8 +791,5 @@ def main():
             else:
                 print("Invalid selection. Please enter 1, 2, 3, or 4.")
 
-    else:
-        print("Failed to authenticate with Google Drive API.")
-
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,321 @@
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from itertools import islice
+from drive_index import iter_folder_files
+
+
+# Every request is stored as its own small segment file next to the request list it belongs to
+SEGMENT_PREFIX = "request-"
+COMPACT_BATCH = 500
+FLUSH_INTERVAL = 60
+FLUSH_SIZE = 50
+# How often the flush timer wakes up, and how long an untouched journal has to sit before
+# it is treated as left behind by a process that died
+TIMER_TICK = 5
+JOURNAL_STALE_AFTER = 60
+# Kept next to the segments while a compaction runs: which segments it folds in and the
+# md5 the request list has once it did, so a rerun after a crash neither loses nor recounts them
+COMPACTION_STATE_NAME = "compaction-state.json"
+RECORD_LINE = re.compile(
+    r"^(?P<label>.+?): (?P<id>\S+)"
+    r"(?: \(requests: (?P<count>\d+), first seen: (?P<first_seen>[^,]*), last seen: (?P<last_seen>[^)]*)\))?$"
+)
+
+
+def append_request(service, folder_id, text):
+    from googleapiclient.http import MediaIoBaseUpload
+    name = f"{SEGMENT_PREFIX}{time.time_ns():020d}-{uuid.uuid4().hex[:8]}.txt"
+    media_body = MediaIoBaseUpload(io.BytesIO(text.encode("utf-8")), mimetype="text/plain")
+    service.files().create(body={"name": name, "parents": [folder_id]}, media_body=media_body, fields="id").execute()
+    return name
+
+
+def iter_segments(service, folder_id):
+    # Segment names start with a zero-padded timestamp, so name order is submission order
+    return iter_folder_files(
+        service, folder_id, fields="id, name", query=f"name contains '{SEGMENT_PREFIX}'", order_by="name"
+    )
+
+
+def _timestamp():
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+class SubmissionQueue:
+    """Collects requests in memory, merging repeats of the same ID, and writes them out in batches.
+
+    start() runs a timer thread that flushes once a batch is full or FLUSH_INTERVAL has
+    passed, even while the caller sits idle. With a ``journal_path`` every submission is
+    first appended to ``<journal_path>.<pid>``, a journal only this process writes. The
+    timer keeps touching it; a journal nobody touched for JOURNAL_STALE_AFTER seconds
+    belongs to a process that died, and the next queue to start takes its requests over.
+    """
+
+    def __init__(self, service, folder_id, label, flush_interval=FLUSH_INTERVAL, flush_size=FLUSH_SIZE,
+                 journal_path=None):
+        self.service = service
+        self.folder_id = folder_id
+        self.label = label
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.journal_path = journal_path
+        self.journal_file = f"{journal_path}.{os.getpid()}" if journal_path else None
+        self.pending = {}
+        self._lock = threading.RLock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._last_flush = time.monotonic()
+        self._adopt_orphaned_journals()
+
+    def _orphaned_journals(self):
+        directory = os.path.dirname(self.journal_path) or "."
+        prefix = os.path.basename(self.journal_path) + "."
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            return []
+        orphaned = []
+        for name in names:
+            path = os.path.join(directory, name)
+            if not name.startswith(prefix) or path == self.journal_file:
+                continue
+            try:
+                if time.time() - os.path.getmtime(path) >= JOURNAL_STALE_AFTER:
+                    orphaned.append(path)
+            except OSError:
+                continue
+        return orphaned
+
+    def _adopt_orphaned_journals(self):
+        if not self.journal_path:
+            return
+        for path in [self.journal_file] + self._orphaned_journals():
+            if path != self.journal_file:
+                # Renaming first means only one starting process can take a journal over
+                claimed = f"{self.journal_file}.claimed-{uuid.uuid4().hex[:8]}"
+                try:
+                    os.rename(path, claimed)
+                except OSError:
+                    continue
+                path = claimed
+            for record in self._read_journal(path):
+                self.pending[record["id"]] = record
+                if path != self.journal_file:
+                    self._journal(record)
+            if path != self.journal_file:
+                os.remove(path)
+
+    @staticmethod
+    def _read_journal(path):
+        try:
+            with open(path, "r") as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return []
+        records = []
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                # A line cut short by a crash mid-write
+                continue
+        return records
+
+    def _journal(self, record):
+        if not self.journal_file:
+            return
+        os.makedirs(os.path.dirname(self.journal_file) or ".", exist_ok=True)
+        with open(self.journal_file, "a") as f:
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def submit(self, game_id):
+        with self._lock:
+            now = _timestamp()
+            record = self.pending.get(game_id)
+            if record:
+                record["count"] += 1
+                record["last_seen"] = now
+            else:
+                record = {"id": game_id, "label": self.label, "count": 1, "first_seen": now, "last_seen": now}
+                self.pending[game_id] = record
+            # The latest line per ID holds its full record, so replaying the journal is idempotent
+            self._journal(record)
+            self.maybe_flush()
+
+    def due(self):
+        if not self.pending:
+            return False
+        return len(self.pending) >= self.flush_size or time.monotonic() - self._last_flush >= self.flush_interval
+
+    def maybe_flush(self):
+        with self._lock:
+            if self.due():
+                self.flush()
+
+    def flush(self):
+        with self._lock:
+            if not self.pending:
+                return 0
+            append_request(self.service, self.folder_id, "\n".join(json.dumps(record) for record in self.pending.values()))
+            flushed = len(self.pending)
+            self.pending.clear()
+            if self.journal_file and os.path.exists(self.journal_file):
+                os.remove(self.journal_file)
+            self._last_flush = time.monotonic()
+            return flushed
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f"flush-{self.label}", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stopped.wait(min(TIMER_TICK, self.flush_interval)):
+            if self.journal_file and os.path.exists(self.journal_file):
+                try:
+                    os.utime(self.journal_file)
+                except OSError:
+                    pass
+            try:
+                self.maybe_flush()
+            except Exception as e:
+                logging.error(f"Error submitting queued requests: {e}")
+
+
+def parse_record(line):
+    """A request record from a segment line (JSON) or a request list line; None for anything else."""
+    try:
+        record = json.loads(line)
+    except ValueError:
+        record = None
+    if isinstance(record, dict):
+        return record
+    match = RECORD_LINE.match(line)
+    if not match:
+        return None
+    # Lines written before requests were counted ("Request for Game ID: 123") count once
+    return {
+        "id": match["id"],
+        "label": match["label"],
+        "count": int(match["count"] or 1),
+        "first_seen": match["first_seen"] or None,
+        "last_seen": match["last_seen"] or None,
+    }
+
+
+def merge_records(lines):
+    merged = {}
+    plain = []
+    for line in lines:
+        record = parse_record(line)
+        if record is None:
+            plain.append(line)
+            continue
+        key = (record.get("label"), record["id"])
+        current = merged.get(key)
+        if current is None:
+            merged[key] = dict(record)
+        else:
+            current["count"] += record["count"]
+            seen = [value for value in (current["first_seen"], record["first_seen"]) if value]
+            current["first_seen"] = min(seen) if seen else None
+            seen = [value for value in (current["last_seen"], record["last_seen"]) if value]
+            current["last_seen"] = max(seen) if seen else None
+    summary = sorted(merged.values(), key=lambda record: record["count"], reverse=True)
+    return summary, plain
+
+
+def format_record(record):
+    if not record["first_seen"]:
+        return f"{record['label']}: {record['id']} (requests: {record['count']})"
+    return (
+        f"{record['label']}: {record['id']} "
+        f"(requests: {record['count']}, first seen: {record['first_seen']}, last seen: {record['last_seen']})"
+    )
+
+
+def _upload_text(service, file_id, text):
+    from googleapiclient.http import MediaIoBaseUpload
+    media_body = MediaIoBaseUpload(io.BytesIO(text.encode("utf-8")), mimetype="text/plain")
+    service.files().update(fileId=file_id, media_body=media_body).execute()
+
+
+def _delete_segments(service, segment_ids):
+    for segment_id in segment_ids:
+        try:
+            service.files().delete(fileId=segment_id).execute()
+        except Exception as e:
+            if getattr(getattr(e, "resp", None), "status", None) != 404:
+                raise
+
+
+def _compaction_state(service, folder_id):
+    """Return (state file ID, state); creates the empty state file on first use."""
+    for file in iter_folder_files(service, folder_id, fields="id, name", query=f"name = '{COMPACTION_STATE_NAME}'"):
+        content = service.files().get_media(fileId=file["id"]).execute().decode("utf-8")
+        try:
+            return file["id"], json.loads(content or "{}")
+        except ValueError:
+            return file["id"], {}
+    from googleapiclient.http import MediaIoBaseUpload
+    media_body = MediaIoBaseUpload(io.BytesIO(b"{}"), mimetype="application/json")
+    created = service.files().create(
+        body={"name": COMPACTION_STATE_NAME, "parents": [folder_id]}, media_body=media_body, fields="id"
+    ).execute()
+    return created["id"], {}
+
+
+def _finish_interrupted(service, target_file_id, state_id, state):
+    if not state.get("segments"):
+        return
+    target = service.files().get(fileId=target_file_id, fields="md5Checksum").execute()
+    if target.get("md5Checksum") == state["result_md5"]:
+        # The request list was rewritten but its segments were not all deleted
+        _delete_segments(service, state["segments"])
+    _upload_text(service, state_id, "{}")
+
+
+def compact_requests(service, folder_id, target_file_id, batch_size=COMPACT_BATCH):
+    """Fold queued segments into the request list, rewriting it as one summary, most requested first.
+
+    Returns that summary, or an empty list when there was nothing to fold in.
+    """
+    state_id, state = _compaction_state(service, folder_id)
+    _finish_interrupted(service, target_file_id, state_id, state)
+    segments = [
+        segment for segment in islice(iter_segments(service, folder_id), batch_size)
+        if segment["name"].startswith(SEGMENT_PREFIX)
+    ]
+    if not segments:
+        return []
+    existing_content = service.files().get_media(fileId=target_file_id).execute().decode("utf-8")
+    lines = [line.strip() for line in existing_content.splitlines() if line.strip()]
+    for segment in segments:
+        content = service.files().get_media(fileId=segment["id"]).execute().decode("utf-8")
+        lines.extend(line.strip() for line in content.splitlines() if line.strip())
+    summary, plain = merge_records(lines)
+    updated_content = "\n".join(plain + [format_record(record) for record in summary]) + "\n"
+    result_md5 = hashlib.md5(updated_content.encode("utf-8")).hexdigest()
+    _upload_text(service, state_id, json.dumps({"segments": [segment["id"] for segment in segments],
+                                                "result_md5": result_md5}))
+    _upload_text(service, target_file_id, updated_content)
+    _delete_segments(service, [segment["id"] for segment in segments])
+    _upload_text(service, state_id, "{}")
+    logging.info(f"Compacted {len(segments)} request segments into {target_file_id}.")
+    return summary
@@ -0,0 +1,9 @@
+"""Starts the Discord bot.
+
+File worker processes are spawned and re-run the main script, so this one imports Bot
+only under the __main__ guard; the workers then load just file_worker.
+"""
+
+if __name__ == "__main__":
+    import Bot
+    Bot.main()
@@ -0,0 +1,317 @@
+import hashlib
+import hmac
+import json
+import os
+import struct
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+# File layout: header, then one sealed frame per plaintext chunk. Every frame except the
+# last holds exactly chunk_size bytes, so frame i always starts at frame_offset(i).
+MAGIC = b"FENC"
+VERSION = 2
+CHUNK_SIZE = 1024 * 1024
+# Frames are independent, so a thread pool can seal and open several chunks at once
+CRYPTO_WORKERS = os.cpu_count() or 1
+TAG_SIZE = 16
+SALT_SIZE = 16
+HEADER = struct.Struct(">4sBBI16s")
+ALGORITHM_AES_GCM = 1
+ALGORITHM_XCHACHA20_POLY1305 = 2
+# Written by the crypto benchmark; "auto" picks the backend recorded here
+BACKEND_CHOICE_FILE = os.path.join(".cache", "crypto_backend.json")
+
+
+class FormatError(ValueError):
+    pass
+
+
+class CryptographyAESGCM:
+    name = "cryptography-aes-gcm"
+    algorithm = ALGORITHM_AES_GCM
+    nonce_size = 12
+
+    def __init__(self, key):
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+        self._aead = AESGCM(key)
+
+    def seal(self, nonce, data, aad):
+        return self._aead.encrypt(nonce, data, aad)
+
+    def open(self, nonce, frame, aad):
+        from cryptography.exceptions import InvalidTag
+        try:
+            return self._aead.decrypt(nonce, frame, aad)
+        except InvalidTag:
+            return None
+
+
+class PyCryptodomeAESGCM:
+    name = "pycryptodome-aes-gcm"
+    algorithm = ALGORITHM_AES_GCM
+    nonce_size = 12
+
+    def __init__(self, key):
+        from Crypto.Cipher import AES
+        self._aes = AES
+        self._key = key
+
+    def seal(self, nonce, data, aad):
+        cipher = self._aes.new(self._key, self._aes.MODE_GCM, nonce=nonce, mac_len=TAG_SIZE)
+        cipher.update(aad)
+        ciphertext, tag = cipher.encrypt_and_digest(data)
+        return ciphertext + tag
+
+    def open(self, nonce, frame, aad):
+        cipher = self._aes.new(self._key, self._aes.MODE_GCM, nonce=nonce, mac_len=TAG_SIZE)
+        cipher.update(aad)
+        try:
+            return cipher.decrypt_and_verify(frame[:-TAG_SIZE], frame[-TAG_SIZE:])
+        except ValueError:
+            return None
+
+
+class SodiumXChaCha20Poly1305:
+    name = "libsodium-xchacha20-poly1305"
+    algorithm = ALGORITHM_XCHACHA20_POLY1305
+    nonce_size = 24
+
+    def __init__(self, key):
+        from nacl import bindings
+        self._bindings = bindings
+        self._key = key
+
+    def seal(self, nonce, data, aad):
+        return self._bindings.crypto_aead_xchacha20poly1305_ietf_encrypt(data, aad, nonce, self._key)
+
+    def open(self, nonce, frame, aad):
+        from nacl.exceptions import CryptoError
+        try:
+            return self._bindings.crypto_aead_xchacha20poly1305_ietf_decrypt(frame, aad, nonce, self._key)
+        except CryptoError:
+            return None
+
+
+BACKENDS = {backend.name: backend for backend in (CryptographyAESGCM, PyCryptodomeAESGCM, SodiumXChaCha20Poly1305)}
+
+
+def available_backends():
+    available = []
+    for backend in BACKENDS.values():
+        try:
+            backend(bytes(32))
+        except ImportError:
+            continue
+        available.append(backend)
+    return available
+
+
+def preferred_backend_name():
+    try:
+        with open(BACKEND_CHOICE_FILE, "r") as f:
+            return json.load(f).get("backend")
+    except (OSError, ValueError):
+        return None
+
+
+def get_backend(name="auto", algorithm=None):
+    candidates = [backend for backend in available_backends() if algorithm in (None, backend.algorithm)]
+    if not candidates:
+        raise RuntimeError("No crypto backend is installed for this payload.")
+    if name == "auto":
+        name = preferred_backend_name()
+    elif name not in BACKENDS:
+        raise ValueError(f"Unknown crypto backend '{name}'; choose one of: auto, {', '.join(BACKENDS)}.")
+    for backend in candidates:
+        if backend.name == name:
+            return backend
+    if name and name in BACKENDS and algorithm is None:
+        raise RuntimeError(f"Crypto backend '{name}' is not installed.")
+    return candidates[0]
+
+
+def _hkdf_sha256(key, salt, info, length=32):
+    prk = hmac.new(salt, key, hashlib.sha256).digest()
+    return hmac.new(prk, info + b"\x01", hashlib.sha256).digest()[:length]
+
+
+class FrameCipher:
+    """AEAD over fixed-size chunks with a per-file subkey.
+
+    The subkey is derived from the caller's key and a random per-file salt, so the chunk
+    index can be used directly as the nonce. The header, chunk index and a final-chunk
+    flag are authenticated with every frame, which catches reordering and truncation.
+    """
+
+    def __init__(self, key, chunk_size=CHUNK_SIZE, salt=None, backend="auto"):
+        if len(key) != 32:
+            raise ValueError("Encryption key must be 32 bytes.")
+        if isinstance(backend, str):
+            backend = get_backend(backend)
+        self.chunk_size = chunk_size
+        self.salt = salt or os.urandom(SALT_SIZE)
+        self.header = HEADER.pack(MAGIC, VERSION, backend.algorithm, chunk_size, self.salt)
+        self.backend = backend(_hkdf_sha256(key, self.salt, b"file-encryption chunk key"))
+
+    @classmethod
+    def from_header(cls, key, header, backend="auto"):
+        if len(header) != HEADER.size:
+            raise FormatError("Truncated header.")
+        magic, version, algorithm, chunk_size, salt = HEADER.unpack(header)
+        if magic != MAGIC:
+            raise FormatError("Not an encrypted payload.")
+        if version != VERSION:
+            raise FormatError(f"Unsupported payload version {version}; this build reads version {VERSION}.")
+        return cls(key, chunk_size, salt, get_backend(backend, algorithm))
+
+    def _nonce_and_aad(self, index, final):
+        return index.to_bytes(self.backend.nonce_size, "big"), self.header + struct.pack(">Q?", index, final)
+
+    def seal(self, index, data, final):
+        nonce, aad = self._nonce_and_aad(index, final)
+        return self.backend.seal(nonce, bytes(data), aad)
+
+    def open(self, index, frame, final):
+        nonce, aad = self._nonce_and_aad(index, final)
+        plaintext = self.backend.open(nonce, bytes(frame), aad)
+        if plaintext is None:
+            raise FormatError(f"Frame {index} failed authentication (corrupt, reordered or truncated).")
+        return plaintext
+
+    def chunk_count(self, plain_size):
+        return max(1, -(-plain_size // self.chunk_size))
+
+    def frame_offset(self, index):
+        return HEADER.size + index * (self.chunk_size + TAG_SIZE)
+
+    def encrypted_size(self, plain_size):
+        return HEADER.size + plain_size + self.chunk_count(plain_size) * TAG_SIZE
+
+
+class EncryptingWriter:
+    """File-like sink that encrypts everything written to it into ``fd``.
+
+    A full chunk is only sealed once more data follows it, so whichever chunk is pending
+    at close() is sealed as the final one.
+    """
+
+    def __init__(self, fd, key, chunk_size=CHUNK_SIZE, backend="auto"):
+        self._fd = fd
+        self._cipher = FrameCipher(key, chunk_size, backend=backend)
+        self._buffer = bytearray()
+        self._index = 0
+        self._fd.write(self._cipher.header)
+
+    def write(self, data):
+        self._buffer += data
+        chunk_size = self._cipher.chunk_size
+        while len(self._buffer) > chunk_size:
+            self._fd.write(self._cipher.seal(self._index, self._buffer[:chunk_size], False))
+            del self._buffer[:chunk_size]
+            self._index += 1
+        return len(data)
+
+    def close(self):
+        self._fd.write(self._cipher.seal(self._index, self._buffer, True))
+        self._buffer = bytearray()
+
+
+def _iter_chunks(src, size):
+    # Reads one chunk ahead so the last chunk can be flagged as final
+    current = src.read(size)
+    index = 0
+    while True:
+        following = src.read(size)
+        yield index, current, not following
+        if not following:
+            return
+        current = following
+        index += 1
+
+
+def _ordered_map(func, items, workers):
+    if workers <= 1:
+        for item in items:
+            yield func(*item)
+        return
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        window = deque()
+        for item in items:
+            window.append(executor.submit(func, *item))
+            if len(window) >= workers * 2:
+                yield window.popleft().result()
+        while window:
+            yield window.popleft().result()
+
+
+def encrypt_stream(src, dst, key, chunk_size=CHUNK_SIZE, workers=1, backend="auto"):
+    cipher = FrameCipher(key, chunk_size, backend=backend)
+    dst.write(cipher.header)
+    for frame in _ordered_map(cipher.seal, _iter_chunks(src, chunk_size), workers):
+        dst.write(frame)
+
+
+def decrypt_stream(src, dst, key, workers=1, backend="auto"):
+    cipher = FrameCipher.from_header(key, src.read(HEADER.size), backend)
+
+    def open_frame(index, frame, final):
+        if len(frame) < TAG_SIZE:
+            raise FormatError("Payload is truncated.")
+        return cipher.open(index, frame, final)
+
+    for chunk in _ordered_map(open_frame, _iter_chunks(src, cipher.chunk_size + TAG_SIZE), workers):
+        dst.write(chunk)
+
+
+def encrypt_file(input_path, output_path, key, chunk_size=CHUNK_SIZE, workers=CRYPTO_WORKERS, backend="auto"):
+    with open(input_path, "rb") as src, open(output_path, "wb") as dst:
+        encrypt_stream(src, dst, key, chunk_size, workers, backend)
+
+
+def decrypt_file(input_path, output_path, key, workers=CRYPTO_WORKERS, backend="auto"):
+    with open(input_path, "rb") as src, open(output_path, "wb") as dst:
+        decrypt_stream(src, dst, key, workers, backend)
+
+
+BENCHMARK_SIZES = (64, 4 * 1024, 64 * 1024, CHUNK_SIZE, 8 * CHUNK_SIZE)
+
+
+def _time_calls(func, duration):
+    calls = 0
+    started = time.perf_counter()
+    while True:
+        func()
+        calls += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= duration:
+            return elapsed / calls
+
+
+def benchmark_backends(sizes=BENCHMARK_SIZES, duration=0.25):
+    """Time every installed backend; returns {name: {size: (seal MB/s, open MB/s, seconds per seal)}}."""
+    results = {}
+    key = os.urandom(32)
+    aad = bytes(HEADER.size + 9)
+    for backend in available_backends():
+        instance = backend(key)
+        nonce = bytes(backend.nonce_size)
+        results[backend.name] = {}
+        for size in sizes:
+            data = os.urandom(size)
+            frame = instance.seal(nonce, data, aad)
+            seal_seconds = _time_calls(lambda: instance.seal(nonce, data, aad), duration)
+            open_seconds = _time_calls(lambda: instance.open(nonce, frame, aad), duration)
+            results[backend.name][size] = (size / seal_seconds / 1e6, size / open_seconds / 1e6, seal_seconds)
+    return results
+
+
+def fastest_backend(results, size=CHUNK_SIZE):
+    return max(results, key=lambda name: sum(results[name][size][:2]))
+
+
+def save_backend_choice(name):
+    os.makedirs(os.path.dirname(BACKEND_CHOICE_FILE), exist_ok=True)
+    with open(BACKEND_CHOICE_FILE, "w") as f:
+        json.dump({"backend": name}, f)
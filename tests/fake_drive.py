@@ -0,0 +1,71 @@
+"""In-process stand-in for the Drive files().list and changes() calls the index makes."""
+import re
+
+FOLDER = "manifests"
+NAME_CLAUSE = re.compile(r"name = '((?:[^'\\]|\\.)*)'")
+
+
+class FakeRequest:
+    def __init__(self, result):
+        self.result = result
+
+    def execute(self):
+        return self.result
+
+
+class FakeDrive:
+    """Just enough of files().list and changes() for DriveFolderIndex, with small pages."""
+
+    def __init__(self, page_size=2):
+        self.page_size = page_size
+        self.files_by_id = {}
+        self.change_log = []
+        self.queries = []
+
+    def files(self):
+        return self
+
+    def changes(self):
+        return FakeChanges(self)
+
+    def put(self, file_id, name, parent=FOLDER, trashed=False, size=1):
+        file = {"id": file_id, "name": name, "size": str(size), "md5Checksum": f"md5-{file_id}-{size}",
+                "modifiedTime": "2026-01-01T00:00:00Z", "parents": [parent], "trashed": trashed}
+        self.files_by_id[file_id] = file
+        self.change_log.append({"fileId": file_id, "removed": False, "file": dict(file)})
+
+    def delete(self, file_id):
+        del self.files_by_id[file_id]
+        self.change_log.append({"fileId": file_id, "removed": True})
+
+    def list(self, q, fields=None, pageSize=100, pageToken=None, orderBy=None):
+        self.queries.append(q)
+        names = {re.sub(r"\\(.)", r"\1", name) for name in NAME_CLAUSE.findall(q)}
+        matches = [
+            {key: value for key, value in file.items() if key not in ("parents", "trashed")}
+            for file in self.files_by_id.values()
+            if f"'{file['parents'][0]}' in parents" in q and not file["trashed"] and (not names or file["name"] in names)
+        ]
+        start = int(pageToken or 0)
+        result = {"files": matches[start:start + pageSize]}
+        if start + pageSize < len(matches):
+            result["nextPageToken"] = str(start + pageSize)
+        return FakeRequest(result)
+
+
+class FakeChanges:
+    def __init__(self, drive):
+        self.drive = drive
+
+    def getStartPageToken(self):
+        return FakeRequest({"startPageToken": str(len(self.drive.change_log))})
+
+    def list(self, pageToken, **kwargs):
+        start = int(pageToken)
+        end = start + self.drive.page_size
+        result = {"changes": self.drive.change_log[start:end]}
+        if end < len(self.drive.change_log):
+            result["nextPageToken"] = str(end)
+        else:
+            result["newStartPageToken"] = str(len(self.drive.change_log))
+        return FakeRequest(result)
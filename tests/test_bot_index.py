@@ -0,0 +1,55 @@
+import asyncio
+import time
+import pytest
+import Bot
+from drive_index import DriveFolderIndex
+from drive_scheduler import BACKGROUND
+from fake_drive import FakeDrive
+
+
+class CountingIndex(DriveFolderIndex):
+    syncs = 0
+
+    def sync(self, service):
+        self.syncs += 1
+        time.sleep(0.05)  # long enough for every lookup to arrive while it runs
+        return super().sync(service)
+
+
+class FakePool:
+    def __init__(self, drive):
+        self.drive = drive
+
+    def get(self):
+        return self.drive
+
+    def stats(self):
+        return {}
+
+
+@pytest.fixture
+def index(tmp_path, monkeypatch):
+    drive = FakeDrive()
+    drive.put("id1", "1.zip", parent=Bot.FOLDER_MANIFEST)
+    index = CountingIndex(Bot.FOLDER_MANIFEST, str(tmp_path / "index.json"))
+    monkeypatch.setattr(Bot, "drive_pool", FakePool(drive))
+    monkeypatch.setattr(Bot, "manifest_index", index)
+    return index
+
+
+def test_concurrent_lookups_share_one_index_sync(index):
+    async def lookups():
+        return await asyncio.gather(Bot.sync_manifest_index(BACKGROUND), *(Bot.lookup_manifest(1) for _ in range(8)))
+
+    background, *files = asyncio.run(lookups())
+    assert background is True
+    assert [file["id"] for file in files] == ["id1"] * 8
+    assert index.syncs == 1
+    assert Bot.index_sync_task is None
+
+
+def test_stale_index_syncs_again_after_the_shared_sync_finished(index, monkeypatch):
+    asyncio.run(Bot.lookup_manifest(1))
+    monkeypatch.setattr(Bot, "INDEX_MAX_AGE", 0)
+    assert asyncio.run(Bot.lookup_manifest(1))["id"] == "id1"
+    assert index.syncs == 2
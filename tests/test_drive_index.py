@@ -0,0 +1,98 @@
+from drive_index import DriveFolderIndex, batch_lookup
+from fake_drive import FOLDER, NAME_CLAUSE, FakeDrive
+
+
+def names(index):
+    return {name: entry["id"] for name, entry in index.entries.items()}
+
+
+def test_full_sync_indexes_only_live_files_in_the_folder(tmp_path):
+    drive = FakeDrive()
+    for i in range(5):
+        drive.put(f"id{i}", f"{i}.zip")
+    drive.put("other", "other.zip", parent="elsewhere")
+    drive.put("old", "old.zip", trashed=True)
+    index = DriveFolderIndex(FOLDER, str(tmp_path / "index.json"))
+    assert not index.ready
+    index.sync(drive)
+    assert names(index) == {f"{i}.zip": f"id{i}" for i in range(5)}
+    assert index.lookup("0.zip")["md5Checksum"] == "md5-id0-1"
+    assert index.page_token == str(len(drive.change_log))
+    assert index.is_fresh(60)
+
+
+def test_change_pages_add_rename_trash_and_remove(tmp_path):
+    drive = FakeDrive()
+    for i in range(4):
+        drive.put(f"id{i}", f"{i}.zip")
+    index = DriveFolderIndex(FOLDER, str(tmp_path / "index.json"))
+    index.full_sync(drive)
+    drive.put("id4", "4.zip")
+    drive.put("id1", "renamed.zip")
+    drive.put("id2", "2.zip", trashed=True)
+    drive.delete("id3")
+    drive.put("id0", "0.zip", parent="elsewhere")
+    drive.put("idx", "x.zip", parent="elsewhere")
+    assert index.sync(drive) == 5
+    assert names(index) == {"4.zip": "id4", "renamed.zip": "id1"}
+    assert index.page_token == str(len(drive.change_log))
+    assert index.sync(drive) == 0
+
+
+def test_replaced_file_takes_over_its_name(tmp_path):
+    drive = FakeDrive()
+    drive.put("id1", "1.zip")
+    index = DriveFolderIndex(FOLDER, str(tmp_path / "index.json"))
+    index.full_sync(drive)
+    drive.put("id2", "1.zip", size=2)
+    drive.delete("id1")
+    index.sync(drive)
+    assert index.lookup("1.zip")["id"] == "id2"
+    assert len(index) == 1
+
+
+def test_page_token_and_entries_survive_a_restart(tmp_path):
+    path = str(tmp_path / "index.json")
+    drive = FakeDrive()
+    drive.put("id1", "1.zip")
+    first = DriveFolderIndex(FOLDER, path)
+    first.full_sync(drive)
+    drive.put("id2", "2.zip")
+    first.sync(drive)
+
+    reloaded = DriveFolderIndex(FOLDER, path)
+    assert reloaded.ready and not reloaded.is_fresh(60)
+    assert reloaded.page_token == first.page_token
+    assert names(reloaded) == {"1.zip": "id1", "2.zip": "id2"}
+    # Only the changes made while it was down are replayed, not a fresh listing
+    drive.delete("id1")
+    drive.queries.clear()
+    assert reloaded.sync(drive) == 1
+    assert drive.queries == []
+    assert names(reloaded) == {"2.zip": "id2"}
+
+    assert not DriveFolderIndex("another-folder", path).ready
+
+
+def test_added_entry_is_replaced_by_later_changes(tmp_path):
+    drive = FakeDrive()
+    index = DriveFolderIndex(FOLDER, str(tmp_path / "index.json"))
+    index.full_sync(drive)
+    drive.put("id1", "1.zip", size=7)
+    index.add({key: value for key, value in drive.files_by_id["id1"].items() if key not in ("parents", "trashed")})
+    assert index.lookup("1.zip")["size"] == "7"
+    drive.delete("id1")
+    index.sync(drive)
+    assert "1.zip" not in index
+
+
+def test_batch_lookup_splits_names_into_chunks(tmp_path):
+    drive = FakeDrive(page_size=100)
+    for i in range(7):
+        drive.put(f"id{i}", f"{i}.zip")
+    drive.put("q", "it's.zip")
+    wanted = [f"{i}.zip" for i in range(7)] + ["1.zip", "missing.zip", "it's.zip"]
+    found = batch_lookup(drive, FOLDER, wanted, chunk_size=3)
+    assert {name: file["id"] for name, file in found.items()} == {**{f"{i}.zip": f"id{i}" for i in range(7)}, "it's.zip": "q"}
+    assert len(drive.queries) == 3
+    assert all(len(NAME_CLAUSE.findall(q)) <= 3 for q in drive.queries)
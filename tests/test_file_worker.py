@@ -0,0 +1,112 @@
+import asyncio
+import os
+import pytest
+from concurrent.futures.process import BrokenProcessPool
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from drive_scheduler import scheduler
+from file_worker import FileJobError, FileWorkerPool
+from tracing import Tracer, span
+
+
+def service_account_info():
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                            serialization.NoEncryption()).decode()
+    return {"type": "service_account", "client_email": "worker@example.iam.gserviceaccount.com",
+            "private_key": pem, "token_uri": "https://oauth2.googleapis.com/token", "project_id": "test"}
+
+
+# Jobs run in spawned workers, so they must be importable module-level functions
+def pid_job(service, value):
+    return os.getpid(), value
+
+
+def drive_call_job(service):
+    with span("drive", method="drive.files.get"):
+        return "done"
+
+
+def failing_job(service):
+    raise KeyError("missing")
+
+
+def flaky_job(service):
+    attempts = []
+
+    def fail_once():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise ConnectionError("dropped")
+    scheduler.call(fail_once)
+
+
+def breaker_job(service):
+    for _ in range(scheduler.breaker_threshold):
+        scheduler._record(True)
+    raise RuntimeError("Drive is down")
+
+
+def dying_job(service):
+    os._exit(1)
+
+
+@pytest.fixture(scope="module")
+def pool():
+    pool = FileWorkerPool(service_account_info(), workers=1)
+    yield pool
+    pool.shutdown()
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_jobs_run_in_worker_processes(pool):
+    pid, value = run(pool.run(pid_job, "x"))
+    assert value == "x"
+    assert pid != os.getpid()
+    assert pool.running == 0
+
+
+def test_drive_calls_in_workers_become_spans_of_the_parent_trace(pool, tmp_path):
+    tracer = Tracer(str(tmp_path / "traces.jsonl"), sample_rate=1.0)
+
+    async def traced():
+        with tracer.trace("request") as trace:
+            with span("upload") as stage:
+                assert await pool.run(drive_call_job) == "done"
+        return trace, stage
+
+    trace, stage = run(traced())
+    spans = {record["name"]: record for record in trace.spans}
+    job, drive = spans["drive_call_job"], spans["drive"]
+    assert (job["name"], job["parent"]) == ("drive_call_job", stage["id"])
+    assert (drive["name"], drive["parent"]) == ("drive", job["id"])
+    assert drive["thread"].startswith("file-worker-")
+    assert stage["start_ms"] <= job["start_ms"] <= drive["start_ms"]
+    assert run(pool.run(drive_call_job)) == "done"
+
+
+def test_job_errors_cross_over_as_file_job_errors(pool):
+    with pytest.raises(FileJobError, match="KeyError: 'missing'") as raised:
+        run(pool.run(failing_job))
+    assert raised.value.worker["pid"] != os.getpid()
+
+
+def test_worker_retries_and_open_circuits_reach_the_pool(pool):
+    before = pool.retries
+    run(pool.run(flaky_job))
+    assert pool.retries > before
+    assert not pool.is_open
+    with pytest.raises(FileJobError):
+        run(pool.run(breaker_job))
+    assert pool.is_open
+
+
+def test_dead_worker_is_replaced(pool):
+    with pytest.raises(BrokenProcessPool):
+        run(pool.run(dying_job))
+    pid, value = run(pool.run(pid_job, "after"))
+    assert value == "after"
+    assert pool.running == 0
@@ -0,0 +1,107 @@
+import os
+import time
+import pytest
+import request_log
+from benchmarks.fakes import FakeDrive
+from request_log import SEGMENT_PREFIX, SubmissionQueue, compact_requests, format_record
+
+FOLDER = "requests"
+
+
+def read_text(drive, file_id):
+    return bytes(drive.content[file_id]).decode("utf-8")
+
+
+def segments(drive):
+    return [file for file in drive.files_by_id.values() if file["name"].startswith(SEGMENT_PREFIX)]
+
+
+@pytest.fixture
+def drive():
+    drive = FakeDrive()
+    drive.target = drive.add_file("For Addition.txt", b"Request for Game ID: 5\n", FOLDER)["id"]
+    return drive
+
+
+def test_compaction_merges_repeats_across_runs_into_one_sorted_summary(drive):
+    queue = SubmissionQueue(drive, FOLDER, "Request for Game ID")
+    for game_id in ("5", "7", "5"):
+        queue.submit(game_id)
+    queue.flush()
+    compact_requests(drive, FOLDER, drive.target)
+    queue.submit("5")
+    queue.submit("9")
+    queue.flush()
+    summary = compact_requests(drive, FOLDER, drive.target)
+
+    assert [(record["id"], record["count"]) for record in summary] == [("5", 4), ("7", 1), ("9", 1)]
+    lines = read_text(drive, drive.target).splitlines()
+    assert lines == [format_record(record) for record in summary]
+    assert not segments(drive)
+    assert compact_requests(drive, FOLDER, drive.target) == []
+
+
+def test_compaction_interrupted_after_the_rewrite_does_not_recount(drive, monkeypatch):
+    queue = SubmissionQueue(drive, FOLDER, "Request for Game ID")
+    queue.submit("5")
+    queue.flush()
+    def crash(service, ids):
+        raise OSError("crash")
+    monkeypatch.setattr(request_log, "_delete_segments", crash)
+    with pytest.raises(OSError):
+        compact_requests(drive, FOLDER, drive.target)
+    monkeypatch.undo()
+
+    compact_requests(drive, FOLDER, drive.target)
+    assert "requests: 2" in read_text(drive, drive.target)
+    assert not segments(drive)
+
+
+def test_journal_survives_a_crash_and_belongs_to_one_process(drive, tmp_path):
+    journal = str(tmp_path / "pending.jsonl")
+    queue = SubmissionQueue(drive, FOLDER, "Request for Game ID", journal_path=journal)
+    queue.submit("5")
+    queue.submit("5")
+    assert queue.journal_file == f"{journal}.{os.getpid()}"
+
+    # Another process's journal that is still being touched is left alone
+    live = f"{journal}.999999"
+    with open(live, "w") as f:
+        f.write('{"id": "8", "label": "Request for Game ID", "count": 1, "first_seen": "a", "last_seen": "a"}\n')
+    restarted = SubmissionQueue(drive, FOLDER, "Request for Game ID", journal_path=journal)
+    assert list(restarted.pending) == ["5"]
+    assert restarted.pending["5"]["count"] == 2
+
+    restarted.flush()
+    assert not os.path.exists(queue.journal_file)
+    assert os.path.exists(live)
+
+
+def test_a_dead_process_journal_is_taken_over_once(drive, tmp_path):
+    journal = str(tmp_path / "pending.jsonl")
+    orphan = f"{journal}.999999"
+    with open(orphan, "w") as f:
+        f.write('{"id": "8", "label": "Request for Game ID", "count": 3, "first_seen": "a", "last_seen": "b"}\n{"id": "8')
+    stale = time.time() - request_log.JOURNAL_STALE_AFTER - 1
+    os.utime(orphan, (stale, stale))
+
+    queue = SubmissionQueue(drive, FOLDER, "Request for Game ID", journal_path=journal)
+    assert queue.pending["8"]["count"] == 3
+    assert not os.path.exists(orphan)
+    assert os.listdir(tmp_path) == [os.path.basename(queue.journal_file)]
+    assert SubmissionQueue(drive, FOLDER, "Request for Game ID", journal_path=journal).pending["8"]["count"] == 3
+
+
+def test_timer_flushes_a_partial_batch_while_the_caller_is_idle(drive, monkeypatch):
+    monkeypatch.setattr(request_log, "TIMER_TICK", 0.01)
+    queue = SubmissionQueue(drive, FOLDER, "Request for Game ID", flush_interval=0.05)
+    queue.start()
+    try:
+        queue.submit("5")
+        deadline = time.monotonic() + 5
+        while not segments(drive) and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        queue.stop()
+    assert len(segments(drive)) == 1
+    assert not queue.pending
@@ -0,0 +1,76 @@
+import io
+import os
+import pytest
+from secure_stream import (
+    ALGORITHM_AES_GCM, ALGORITHM_XCHACHA20_POLY1305, BACKENDS, HEADER, TAG_SIZE, FormatError, available_backends,
+    decrypt_stream, encrypt_stream, get_backend,
+)
+
+CHUNK = 64
+KEY = bytes(range(32))
+INSTALLED = {backend.name for backend in available_backends()}
+
+
+def encrypt(data, backend="cryptography-aes-gcm", workers=1):
+    out = io.BytesIO()
+    encrypt_stream(io.BytesIO(data), out, KEY, CHUNK, workers, backend)
+    return out.getvalue()
+
+
+def decrypt(payload, workers=1):
+    out = io.BytesIO()
+    decrypt_stream(io.BytesIO(payload), out, KEY, workers)
+    return out.getvalue()
+
+
+def frames(payload):
+    body = payload[HEADER.size:]
+    size = CHUNK + TAG_SIZE
+    return payload[:HEADER.size], [body[i:i + size] for i in range(0, len(body), size)]
+
+
+@pytest.mark.parametrize("backend", list(BACKENDS))
+@pytest.mark.parametrize("size", [0, 1, CHUNK, 3 * CHUNK + 5])
+def test_round_trip_with_every_backend(backend, size):
+    if backend not in INSTALLED:
+        pytest.skip(f"{backend} is not installed")
+    data = os.urandom(size)
+    payload = encrypt(data, backend, workers=2)
+    assert len(payload) == HEADER.size + size + max(1, -(-size // CHUNK)) * TAG_SIZE
+    assert decrypt(payload, workers=2) == data
+
+
+def test_flipped_bit_is_rejected():
+    payload = bytearray(encrypt(os.urandom(3 * CHUNK)))
+    payload[HEADER.size + CHUNK + TAG_SIZE + 3] ^= 1
+    with pytest.raises(FormatError, match="Frame 1"):
+        decrypt(bytes(payload))
+
+
+def test_truncation_at_a_frame_boundary_is_rejected():
+    header, sealed = frames(encrypt(os.urandom(3 * CHUNK)))
+    with pytest.raises(FormatError, match="Frame 1"):
+        decrypt(header + b"".join(sealed[:2]))
+
+
+def test_swapped_frames_are_rejected():
+    header, sealed = frames(encrypt(os.urandom(3 * CHUNK)))
+    with pytest.raises(FormatError, match="Frame 0"):
+        decrypt(header + sealed[1] + sealed[0] + sealed[2])
+
+
+def test_altered_algorithm_byte_is_rejected():
+    if "libsodium-xchacha20-poly1305" not in INSTALLED:
+        pytest.skip("needs a second algorithm to switch to")
+    payload = bytearray(encrypt(os.urandom(2 * CHUNK)))
+    assert payload[5] == ALGORITHM_AES_GCM
+    payload[5] = ALGORITHM_XCHACHA20_POLY1305
+    with pytest.raises(FormatError, match="Frame 0"):
+        decrypt(bytes(payload))
+
+
+def test_unknown_backend_is_an_error():
+    with pytest.raises(ValueError, match="Unknown crypto backend 'aes-ocb'"):
+        get_backend("aes-ocb")
+    with pytest.raises(ValueError, match="Unknown crypto backend"):
+        encrypt(b"data", backend="aes-ocb")
@@ -0,0 +1,23 @@
+import asyncio
+from tracing import Tracer
+
+
+def test_profile_session_finishes_once_when_the_timeout_races_the_last_request(tmp_path):
+    errors = []
+
+    async def profile():
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: errors.append(context))
+        tracer = Tracer(str(tmp_path / "traces.jsonl"))
+        done = tracer.profile_next(1)
+        session = tracer.profile_session
+        with tracer.trace("request"):
+            # The /profile timeout fires while the last profiled request is finishing
+            session.finish()
+        session.finish()
+        report = await done
+        await asyncio.sleep(0)
+        return report
+
+    report = asyncio.run(profile())
+    assert "busy samples" in report
+    assert not errors
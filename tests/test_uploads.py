@@ -0,0 +1,113 @@
+import hashlib
+import json
+import zipfile
+import pytest
+from googleapiclient.discovery import build
+from googleapiclient.http import HttpMockSequence
+import file_worker
+from drive_scheduler import ScheduledHttpRequest, scheduler
+from file_worker import UPLOAD_CHUNK_UNIT, TunableMediaUpload, create_zip_file, upload_file, upload_key
+
+UPLOAD_URI = "https://upload.example/session/1"
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(file_worker, "UPLOAD_SESSIONS_FILE", str(tmp_path / "sessions.json"))
+    monkeypatch.setattr(file_worker, "UPLOAD_RETRY_DELAY", 0)
+    monkeypatch.setattr(scheduler, "rate", 0)
+    monkeypatch.setattr(scheduler, "max_retries", 0)
+    return tmp_path
+
+
+def drive(responses):
+    http = HttpMockSequence(responses)
+    return build("drive", "v3", http=http, requestBuilder=ScheduledHttpRequest, static_discovery=True), http
+
+
+def payload(path, size):
+    path.write_bytes(bytes(range(256)) * (size // 256) + b"x" * (size % 256))
+    return str(path)
+
+
+def received(offset):
+    return {"status": "308", "range": f"bytes=0-{offset - 1}"}
+
+
+def chunk_ranges(http):
+    return [headers["Content-Range"] for uri, method, body, headers in http.request_sequence
+            if method == "PUT" and not headers["Content-Range"].startswith("bytes */")]
+
+
+def test_client_reads_chunk_size_before_every_chunk(workdir):
+    # TunableMediaUpload relies on the client calling chunksize() for each chunk
+    path = payload(workdir / "game.zip", 3 * UPLOAD_CHUNK_UNIT + 10)
+    service, http = drive([
+        ({"status": "200", "location": UPLOAD_URI}, ""),
+        (received(UPLOAD_CHUNK_UNIT), ""),
+        ({"status": "200"}, json.dumps({"id": "f1"})),
+    ])
+    media = TunableMediaUpload(path, chunksize=UPLOAD_CHUNK_UNIT)
+    request = service.files().create(body={"name": "game.zip"}, media_body=media, fields="id")
+    status, response = request.next_chunk()
+    assert request.resumable_uri == UPLOAD_URI
+    assert request.resumable_progress == UPLOAD_CHUNK_UNIT
+    media.chunk_size = 4 * UPLOAD_CHUNK_UNIT
+    status, response = request.next_chunk()
+    assert response == {"id": "f1"}
+    assert chunk_ranges(http) == [
+        f"bytes 0-{UPLOAD_CHUNK_UNIT - 1}/{3 * UPLOAD_CHUNK_UNIT + 10}",
+        f"bytes {UPLOAD_CHUNK_UNIT}-{3 * UPLOAD_CHUNK_UNIT + 9}/{3 * UPLOAD_CHUNK_UNIT + 10}",
+    ]
+
+
+def test_upload_resumes_saved_session_from_drive_progress(workdir):
+    size = 2 * UPLOAD_CHUNK_UNIT
+    path = payload(workdir / "game.zip", size)
+    file_worker.save_upload_session(upload_key(path, "game.zip"), UPLOAD_URI)
+    service, http = drive([
+        (received(UPLOAD_CHUNK_UNIT), ""),
+        ({"status": "200"}, json.dumps({"id": "f1"})),
+    ])
+    assert upload_file(service, path, "game.zip", "folder") == {"id": "f1"}
+    assert http.request_sequence[0][3]["Content-Range"] == f"bytes */{size}"
+    assert chunk_ranges(http) == [f"bytes {UPLOAD_CHUNK_UNIT}-{size - 1}/{size}"]
+    assert file_worker.load_upload_sessions() == {}
+
+
+def test_upload_restarts_when_saved_session_is_gone(workdir):
+    path = payload(workdir / "game.zip", 100)
+    file_worker.save_upload_session(upload_key(path, "game.zip"), UPLOAD_URI)
+    service, http = drive([
+        ({"status": "404"}, ""),
+        ({"status": "200", "location": UPLOAD_URI + "2"}, ""),
+        ({"status": "200"}, json.dumps({"id": "f2"})),
+    ])
+    assert upload_file(service, path, "game.zip", "folder") == {"id": "f2"}
+    assert chunk_ranges(http) == ["bytes 0-99/100"]
+
+
+def test_failed_chunk_is_resent_from_drive_progress(workdir):
+    size = 3 * UPLOAD_CHUNK_UNIT
+    path = payload(workdir / "game.zip", size)
+    service, http = drive([
+        ({"status": "200", "location": UPLOAD_URI}, ""),
+        (received(UPLOAD_CHUNK_UNIT), ""),
+        ({"status": "503"}, ""),
+        (received(2 * UPLOAD_CHUNK_UNIT), ""),
+        (received(2 * UPLOAD_CHUNK_UNIT), ""),
+        ({"status": "200"}, json.dumps({"id": "f3"})),
+    ])
+    assert upload_file(service, path, "game.zip", "folder") == {"id": "f3"}
+    assert chunk_ranges(http)[-1] == f"bytes {2 * UPLOAD_CHUNK_UNIT}-{size - 1}/{size}"
+
+
+def test_zip_bytes_do_not_depend_on_build_time(workdir, monkeypatch):
+    files = [("a.manifest", b"one"), ("b.lua", "two")]
+    digests = []
+    for now in (0, 1_000_000_000):
+        monkeypatch.setattr(zipfile.time, "time", lambda: now)
+        with open(create_zip_file("1", files), "rb") as f:
+            digests.append(hashlib.md5(f.read()).hexdigest())
+    assert digests[0] == digests[1]
@@ -0,0 +1,280 @@
+import asyncio
+import cProfile
+import contextvars
+import io
+import itertools
+import json
+import logging
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+
+TRACE_FILE = os.path.join("temp", "traces.jsonl")
+SAMPLE_RATE = 0.0
+SAMPLING_INTERVAL = 0.005
+REPORT_LINES = 30
+# Stacks ending in these modules are threads waiting for work, not doing it
+IDLE_MODULES = ("selectors.py", "threading.py", "queue.py", "thread.py")
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+_span_ids = itertools.count(1)
+
+
+class Trace:
+    def __init__(self, tracer, name, attrs):
+        self.tracer = tracer
+        self.trace_id = os.urandom(8).hex()
+        self.name = name
+        self.attrs = attrs
+        self.started_at = time.time()
+        self.error = None
+        self.spans = []
+        self.profile_session = None
+        self._started = time.perf_counter()
+        self._holds = 1
+        self._lock = threading.Lock()
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self._started) * 1000
+
+    def hold(self):
+        """Keep the trace open until a matching release(), e.g. while a queued job runs."""
+        with self._lock:
+            self._holds += 1
+
+    def release(self):
+        with self._lock:
+            self._holds -= 1
+            if self._holds:
+                return
+        self.tracer._finish(self)
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "start": self.started_at,
+            "duration_ms": round(self.elapsed_ms(), 3),
+            "attrs": self.attrs,
+            "error": self.error,
+            "spans": self.spans,
+        }
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+@contextmanager
+def resume(trace):
+    """Make ``trace`` current again in another task, e.g. the worker that runs a queued job."""
+    token = _current_trace.set(trace)
+    span_token = _current_span.set(None)
+    try:
+        yield trace
+    finally:
+        _current_span.reset(span_token)
+        _current_trace.reset(token)
+
+
+@contextmanager
+def span(name, **attrs):
+    """Time a block as a child of the current span; does nothing outside a sampled trace."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+    record = {"id": next(_span_ids), "parent": _current_span.get(), "name": name,
+              "start_ms": round(trace.elapsed_ms(), 3), "thread": threading.current_thread().name}
+    if attrs:
+        record["attrs"] = attrs
+    token = _current_span.set(record["id"])
+    try:
+        yield record
+    except BaseException as e:
+        record["error"] = repr(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        record["duration_ms"] = round(trace.elapsed_ms() - record["start_ms"], 3)
+        trace.spans.append(record)
+
+
+@contextmanager
+def capture(name, **attrs):
+    """Record spans outside any Tracer, e.g. in a worker process; yields the trace holding them.
+
+    The caller ships ``trace.started_at`` and ``trace.spans`` back and hands them to
+    adopt_spans() in the process that owns the real trace.
+    """
+    trace = Trace(None, name, attrs)
+    with resume(trace), span(name, **attrs):
+        yield trace
+
+
+def adopt_spans(spans, started_at, thread):
+    """Add spans recorded by capture() elsewhere under the current span, on this trace's clock."""
+    trace = _current_trace.get()
+    if trace is None or not spans:
+        return
+    offset_ms = (started_at - trace.started_at) * 1000
+    parent = _current_span.get()
+    ids = {record["id"]: next(_span_ids) for record in spans}
+    for record in spans:
+        trace.spans.append(dict(
+            record, id=ids[record["id"]], parent=ids.get(record["parent"], parent),
+            start_ms=round(record["start_ms"] + offset_ms, 3), thread=thread,
+        ))
+
+
+class StackSampler:
+    """Wall-clock sampling profiler covering every thread, including the Drive workers."""
+
+    def __init__(self, interval=SAMPLING_INTERVAL):
+        self.interval = interval
+        self.samples = 0
+        self._stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def enable(self):
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def disable(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own or frame.f_code.co_filename.endswith(IDLE_MODULES):
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_firstlineno}({code.co_name})")
+                    frame = frame.f_back
+                self._stacks[tuple(stack)] += 1
+                self.samples += 1
+
+    def report(self, limit=REPORT_LINES):
+        own, total = Counter(), Counter()
+        for stack, count in self._stacks.items():
+            own[stack[0]] += count
+            for function in set(stack):
+                total[function] += count
+        lines = [f"{self.samples} busy samples every {self.interval * 1000:g} ms", "",
+                 f"{'total%':>7} {'self%':>7}  function"]
+        for function, count in total.most_common(limit):
+            share = 100 / max(1, self.samples)
+            lines.append(f"{count * share:7.1f} {own[function] * share:7.1f}  {function}")
+        return "\n".join(lines)
+
+
+class ProfileSession:
+    def __init__(self, count, mode):
+        self.remaining = count
+        self.active = 0
+        self.profiler = None
+        self.mode = mode
+        self.finished = False
+        self.done = asyncio.get_running_loop().create_future()
+
+    def enter(self):
+        if self.profiler is None:
+            self.profiler = cProfile.Profile() if self.mode == "cprofile" else StackSampler()
+            self.profiler.enable()
+        self.remaining -= 1
+        self.active += 1
+
+    def exit(self):
+        self.active -= 1
+        if self.remaining <= 0 and self.active == 0:
+            self.finish()
+
+    def finish(self):
+        # The last traced request and the /profile timeout can both get here
+        if self.finished:
+            return
+        self.finished = True
+        report = "No requests were profiled."
+        if self.profiler is not None:
+            self.profiler.disable()
+            report = self.report()
+        self.done.get_loop().call_soon_threadsafe(self._resolve, report)
+
+    def _resolve(self, report):
+        if not self.done.done():
+            self.done.set_result(report)
+
+    def report(self):
+        if isinstance(self.profiler, StackSampler):
+            return self.profiler.report()
+        out = io.StringIO()
+        pstats.Stats(self.profiler, stream=out).sort_stats("cumulative").print_stats(REPORT_LINES)
+        return out.getvalue()
+
+
+class Tracer:
+    """Records sampled requests as JSON lines, one trace per line with all of its spans.
+
+    A profiling session forces the next few traces to be sampled and profiles them with
+    cProfile (event-loop thread only) or a stack sampler (all threads).
+    """
+
+    def __init__(self, path=TRACE_FILE, sample_rate=SAMPLE_RATE):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.profile_session = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def trace(self, name, **attrs):
+        session = self.profile_session
+        profiling = session is not None and session.remaining > 0
+        if not profiling and random.random() >= self.sample_rate:
+            yield None
+            return
+        trace = Trace(self, name, attrs)
+        if profiling:
+            session.enter()
+            trace.profile_session = session
+        with resume(trace):
+            try:
+                yield trace
+            except BaseException as e:
+                trace.error = repr(e)
+                raise
+            finally:
+                trace.release()
+
+    def profile_next(self, count, mode="sampling"):
+        """Profile the next ``count`` traced requests; returns a future resolving to the report."""
+        if self.profile_session is not None:
+            self.profile_session.finish()
+        self.profile_session = ProfileSession(count, mode)
+        return self.profile_session.done
+
+    def _finish(self, trace):
+        if trace.profile_session is not None:
+            trace.profile_session.exit()
+        line = json.dumps(trace.to_dict(), default=str)
+        try:
+            with self._lock:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                with open(self.path, "a") as f:
+                    f.write(line + "\n")
+        except OSError as e:
+            logging.warning(f"Could not write trace {trace.trace_id}: {e}")
+
+
+tracer = Tracer()